@@ -0,0 +1,93 @@
+"""
+Measure the command/ack round trip through EventMachine, and the CPU burnt
+by threads blocked in waitFor, against a loopback driver that acknowledges
+every command as soon as it is written.
+
+"""
+
+from __future__ import division, print_function
+
+import time
+from threading import Condition, Thread
+
+from ant.core import message
+from ant.core.driver import Driver
+from ant.core.event import EventMachine
+from ant.core.exceptions import MessageError
+from ant.core.message import Message
+
+COMMANDS = 2000
+WAITERS = 20
+
+
+class LoopbackDriver(Driver):
+    def __init__(self):
+        super(LoopbackDriver, self).__init__()
+        self._buffer = bytearray()
+        self._ready = Condition()
+        self._isOpen = False
+    
+    @property
+    def _opened(self):
+        return self._isOpen
+    
+    def _open(self):
+        self._isOpen = True
+    
+    def _close(self):
+        self._isOpen = False
+    
+    def _read(self, count):
+        with self._ready:
+            if not self._buffer:
+                self._ready.wait(0.01)
+            data = bytes(self._buffer[:count])
+            del self._buffer[:count]
+        return data
+    
+    def _write(self, data):
+        msg = Message.decode(data)
+        ack = message.ChannelEventResponseMessage(msg.channelNumber, msg.type, 0)
+        with self._ready:
+            self._buffer += ack.encode()
+            self._ready.notify()
+        return len(data)
+
+
+def percentile(samples, fraction):
+    return sorted(samples)[int(len(samples) * fraction)]
+
+
+def main():
+    evm = EventMachine(LoopbackDriver())
+    evm.start()
+    try:
+        samples = []
+        for _ in range(COMMANDS):
+            msg = message.ChannelPeriodMessage(0, 8192)
+            start = time.time()
+            evm.writeMessage(msg).waitForAck(msg)
+            samples.append((time.time() - start) * 1e6)
+        print('round trip (us): median %.0f, p99 %.0f, max %.0f' % (
+            percentile(samples, 0.5), percentile(samples, 0.99), max(samples)))
+        
+        def wait():
+            try:
+                evm.msg.waitFor(message.SerialNumberMessage, timeout=1)
+            except MessageError:
+                pass
+        
+        threads = [Thread(target=wait) for _ in range(WAITERS)]
+        cpu, wall = time.process_time(), time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print('%d idle waiters: %.1f%% CPU' % (
+            WAITERS, (time.process_time() - cpu) / (time.time() - wall) * 100))
+    finally:
+        evm.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Time to bring up every channel of a stick, one acknowledged command at a time,
+one thread per channel, and pipelined through Node.configureChannels. The simulated stick takes
+LATENCY seconds to move a frame across the bus in each direction and handles
+its commands one after the other, PROCESSING seconds each.
+
+"""
+
+from __future__ import division, print_function
+
+import time
+from threading import Condition, Thread, Timer
+
+from six.moves.queue import Queue
+
+from ant.core import message
+from ant.core.constants import CHANNEL_TYPE_TWOWAY_RECEIVE, MESSAGE_CAPABILITIES
+from ant.core.driver import Driver
+from ant.core.message import Message
+from ant.core.node import Network, Node
+
+LATENCY = 0.001
+PROCESSING = 0.0002
+CHANNELS = 8
+ROUNDS = 10
+
+
+class SimulatedStick(Driver):
+    def __init__(self):
+        super(SimulatedStick, self).__init__()
+        self._buffer = bytearray()
+        self._ready = Condition()
+        self._commands = Queue()
+        self._isOpen = False
+    
+    @property
+    def _opened(self):
+        return self._isOpen
+    
+    def _open(self):
+        self._isOpen = True
+        Thread(target=self._run).start()
+    
+    def _close(self):
+        self._isOpen = False
+        self._commands.put(None)
+    
+    def _read(self, count):
+        with self._ready:
+            if not self._buffer:
+                self._ready.wait(0.01)
+            data = bytes(self._buffer[:count])
+            del self._buffer[:count]
+        return data
+    
+    def _write(self, data):
+        self._commands.put((time.time() + LATENCY, Message.decode(data)))
+        return len(data)
+    
+    def _reply(self, msg):
+        with self._ready:
+            self._buffer += msg.encode()
+            self._ready.notify()
+    
+    def _run(self):
+        while True:
+            command = self._commands.get()
+            if command is None:
+                return
+            arrival, msg = command
+            delay = arrival - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            time.sleep(PROCESSING)
+            
+            if isinstance(msg, message.SystemResetMessage):
+                reply = message.StartupMessage()
+            elif isinstance(msg, message.ChannelRequestMessage) and \
+                 msg.messageID == MESSAGE_CAPABILITIES:
+                reply = message.CapabilitiesMessage(CHANNELS, 3)
+            else:
+                number = msg.number if isinstance(msg, message.NetworkKeyMessage) \
+                         else msg.channelNumber
+                reply = message.ChannelEventResponseMessage(number, msg.type, 0)
+            Timer(LATENCY, self._reply, (reply,)).start()
+
+
+def setup(channel, network):
+    channel.assign(network, CHANNEL_TYPE_TWOWAY_RECEIVE)
+    channel.setID(120, 0, 0)
+    channel.searchTimeout = 255
+    channel.period = 8070
+    channel.frequency = 57
+    channel.open()
+
+
+def serial(node, network):
+    for channel in node.channels:
+        setup(channel, network)
+
+
+def threaded(node, network):
+    threads = [Thread(target=setup, args=(channel, network))
+               for channel in node.channels]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def pipelined(node, network):
+    node.configureChannels([
+        (channel, dict(network=network, channelType=CHANNEL_TYPE_TWOWAY_RECEIVE,
+                       channelID=(120, 0, 0), searchTimeout=255, period=8070,
+                       frequency=57, open=True))
+        for channel in node.channels])
+
+
+def measure(strategy):
+    samples = []
+    for _ in range(ROUNDS):
+        node = Node(SimulatedStick())
+        node.start()
+        try:
+            network = Network(key=b'\x00' * 8)
+            node.setNetworkKey(0, network)
+            start = time.time()
+            strategy(node, network)
+            samples.append((time.time() - start) * 1e3)
+        finally:
+            node.stop()
+    return sorted(samples)[len(samples) // 2]
+
+
+def main():
+    print('%d channels, %.1f ms bus latency, %.1f ms per command'
+          % (CHANNELS, LATENCY * 1e3, PROCESSING * 1e3))
+    for strategy in (serial, threaded, pipelined):
+        print('%-10s median %6.1f ms' % (strategy.__name__, measure(strategy)))
+
+
+if __name__ == '__main__':
+    main()
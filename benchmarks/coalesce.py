@@ -0,0 +1,78 @@
+"""
+USB transfers and write latency with and without the coalescing writer.
+THREADS threads each send FRAMES acknowledged data frames through one
+driver whose every transfer costs TRANSFER seconds, as a bulk transfer to a
+full speed USB device takes about a frame.
+
+"""
+
+from __future__ import division, print_function
+
+import time
+from threading import Thread
+
+from ant.core import message
+from ant.core.driver import Driver
+
+THREADS = 8
+FRAMES = 100
+TRANSFER = 0.001
+
+
+class SlowDriver(Driver):
+    def __init__(self, coalesce):
+        super(SlowDriver, self).__init__(coalesce=coalesce)
+        self.transfers = 0
+        self._isOpen = False
+    
+    @property
+    def _opened(self):
+        return self._isOpen
+    
+    def _open(self):
+        self._isOpen = True
+    
+    def _close(self):
+        self._isOpen = False
+    
+    def _write(self, data):
+        self.transfers += 1
+        time.sleep(TRANSFER)
+        return len(data)
+
+
+def measure(coalesce):
+    driver = SlowDriver(coalesce)
+    driver.open()
+    latencies = []
+    
+    def send(number):
+        frame = message.ChannelAcknowledgedDataMessage(number, data=b'\x00' * 8)
+        for _ in range(FRAMES):
+            start = time.time()
+            driver.write(frame)
+            latencies.append(time.time() - start)
+    
+    threads = [Thread(target=send, args=(number,)) for number in range(THREADS)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    driver.close()
+    latencies.sort()
+    return (driver.transfers, elapsed * 1e3,
+            latencies[len(latencies) // 2] * 1e3, latencies[int(len(latencies) * 0.99)] * 1e3)
+
+
+def main():
+    print('%d threads x %d frames, %.1f ms per transfer' % (THREADS, FRAMES, TRANSFER * 1e3))
+    print('            transfers   total ms   median ms   p99 ms')
+    for coalesce in (False, True):
+        name = 'coalesced' if coalesce else 'direct'
+        print('%-10s  %9d   %8.0f   %9.2f   %6.2f' % ((name,) + measure(coalesce)))
+
+
+if __name__ == '__main__':
+    main()
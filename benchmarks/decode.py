@@ -0,0 +1,47 @@
+"""
+Compare Message.decode against the previous decode path, which went through
+MessageType.__call__, the message's __init__ and the payload setter.
+
+"""
+
+from __future__ import division, print_function
+
+import timeit
+
+from ant.core import message
+from ant.core.constants import MESSAGE_CHANNEL_ASSIGN
+from ant.core.message import Message, MSG_HEADER_SIZE
+
+ROUNDS = 100000
+
+FRAMES = (
+    ('broadcast', message.ChannelBroadcastDataMessage(
+        1, b'\x01\x02\x03\x04\x05\x06\x07\x08')),
+    ('event-response', message.ChannelEventResponseMessage(
+        1, MESSAGE_CHANNEL_ASSIGN, 0x00)),
+    ('capabilities', message.CapabilitiesMessage(8, 3, 0x00, 0xBA, 0x36)),
+)
+
+
+def legacy_decode(raw):
+    raw = bytearray(raw)
+    _, length, type_ = raw[:MSG_HEADER_SIZE]
+    msg = Message(type=type_)  # pylint: disable=unexpected-keyword-arg
+    msg.payload = raw[MSG_HEADER_SIZE:length + MSG_HEADER_SIZE]
+    if msg.checksum != raw[length + MSG_HEADER_SIZE]:
+        raise ValueError('bad checksum')
+    return msg
+
+
+def main():
+    print('%-16s %12s %12s %8s' % ('message', 'legacy (us)', 'table (us)', 'speedup'))
+    for name, msg in FRAMES:
+        raw = bytes(msg.encode())
+        legacy = min(timeit.repeat(lambda: legacy_decode(raw), number=ROUNDS, repeat=3))
+        table = min(timeit.repeat(lambda: Message.decode(raw), number=ROUNDS, repeat=3))
+        print('%-16s %12.3f %12.3f %7.2fx' % (name, legacy / ROUNDS * 1e6,
+                                              table / ROUNDS * 1e6, legacy / table))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Measure the memory held per decoded message with tracemalloc, and time a
+multi-byte field read.
+
+"""
+
+from __future__ import division, print_function
+
+import timeit
+import tracemalloc
+
+from ant.core import message
+from ant.core.message import Message
+
+COUNT = 10000
+
+FRAMES = (
+    ('broadcast', message.ChannelBroadcastDataMessage(
+        1, b'\x01\x02\x03\x04\x05\x06\x07\x08')),
+    ('channel-id', message.ChannelIDMessage(1, 0x1234, 120, 1)),
+    ('event-response', message.ChannelEventResponseMessage(1, 0x42, 0x00)),
+)
+
+
+def footprint(raw, frozen):
+    stream = raw * COUNT
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    parser = message.FrameParser(frozen=frozen)
+    messages = list(parser.feed(stream))
+    del parser
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del messages
+    return (after - before) / COUNT
+
+
+def main():
+    print('%-16s %14s %14s' % ('message', 'bytes/message', 'frozen'))
+    for name, msg in FRAMES:
+        raw = bytes(msg.encode())
+        print('%-16s %14.1f %14.1f' % (name, footprint(raw, False), footprint(raw, True)))
+    
+    msg = Message.decode(bytes(FRAMES[1][1].encode()))
+    rounds = 200000
+    elapsed = min(timeit.repeat(lambda: msg.deviceNumber, number=rounds, repeat=3))
+    print('ChannelIDMessage.deviceNumber: %.3f us/read' % (elapsed / rounds * 1e6))
+
+
+if __name__ == '__main__':
+    main()
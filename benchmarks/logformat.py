@@ -0,0 +1,108 @@
+"""
+Size, write and read throughput of a capture in each log format. An hour of
+eight heart rate monitors is captured from a SimulatedDriver on its virtual
+clock, then written out again by LogWriter as version 1, and as version 2
+uncompressed, with zlib and with lzma, keeping the virtual timestamps.
+
+"""
+
+from __future__ import division, print_function
+
+import os
+import time
+
+from ant.core.log import (EVENT_CLOSE, EVENT_OPEN, EVENT_READ, EVENT_WRITE,
+                          LogReader, LogWriter)
+from ant.core.node import Network, Node
+from ant.core.simulator import HeartRateDevice, SimulatedDriver
+
+LOG = '/tmp/python-ant.logformat-bench.ant'
+CHANNELS = 8
+SECONDS = 3600
+FORMATS = [('v1', dict(version=1)),
+           ('v2', dict(version=2)),
+           ('v2 zlib', dict(version=2, compression='zlib')),
+           ('v2 lzma', dict(version=2, compression='lzma'))]
+
+
+class Capture(object):
+    # just enough of LogWriter for a driver, stamping records in virtual ns
+    def __init__(self):
+        self.records = []
+        self.driver = None
+    
+    def _logEvent(self, event, data=None):
+        stamp = int(self.driver.clock * 1000000000)
+        if data is None:
+            self.records.append((event, stamp))
+        elif len(data):
+            self.records.append((event, stamp, bytes(data)))
+    
+    logOpen = lambda self: self._logEvent(EVENT_OPEN)
+    logClose = lambda self: self._logEvent(EVENT_CLOSE)
+    logRead = lambda self, data: self._logEvent(EVENT_READ, data)
+    logWrite = lambda self, data: self._logEvent(EVENT_WRITE, data)
+
+
+def capture():
+    log = Capture()
+    driver = SimulatedDriver([HeartRateDevice(number + 1) for number in range(CHANNELS)],
+                             realtime=False, maxChannels=CHANNELS, log=log)
+    log.driver = driver
+    node = Node(driver)
+    node.start()
+    try:
+        network = Network(key=b'\x00' * 8)
+        node.setNetworkKey(0, network)
+        node.configureChannels([(channel, dict(network=network,
+                                               channelID=(120, number + 1, 0),
+                                               open=True))
+                                for number, channel in enumerate(node.channels)])
+        while driver.clock < SECONDS:
+            time.sleep(0.05)
+    finally:
+        node.stop()
+    return log.records
+
+
+def write(records, options):
+    writer = LogWriter(LOG, **options)
+    if writer.version == 1:
+        base = time.time()
+        stamps = iter([base + record[1] / 1e9 for record in records])
+    else:
+        stamps = iter([writer.start + record[1] for record in records])
+    writer.clock = lambda: next(stamps)
+    
+    start = time.time()
+    for record in records:
+        writer._logEvent(record[0], *record[2:])  # pylint: disable=protected-access
+    writer.close()
+    return time.time() - start
+
+
+def read():
+    start = time.time()
+    count = sum(1 for _ in LogReader(LOG))
+    return count, time.time() - start
+
+
+def main():
+    records = capture()
+    print('%d records, %d bytes of frames'
+          % (len(records), sum(len(record[2]) for record in records if len(record) == 3)))
+    
+    base = None
+    for name, options in FORMATS:
+        written = write(records, options)
+        size = os.path.getsize(LOG)
+        base = base or size
+        count, elapsed = read()
+        assert count == len(records)
+        print('%-8s %8.0f KB (%5.1fx)  write %8.0f records/s  read %8.0f records/s'
+              % (name, size / 1024, base / size, len(records) / written,
+                 len(records) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Time to read one minute out of a ten hour capture, from the top of the file
+and through an index. The capture is RATE broadcast frames a second, written
+as a version 1 log (indexed afterwards with buildIndex) and as a zlib
+compressed version 2 log (indexed as it is written).
+
+"""
+
+from __future__ import division, print_function
+
+import os
+import time
+
+from ant.core import message
+from ant.core.log import INDEX_SUFFIX, LogReader, LogWriter, buildIndex
+
+LOG = '/tmp/python-ant.logindex-bench.ant'
+HOURS = 10
+RATE = 32
+QUERY = 7 * 3600 + 32 * 60  # seconds into the capture
+REPEAT = 5
+
+
+def generate(filename, **options):
+    frame = message.ChannelBroadcastDataMessage(0, data=b'\x00' * 8).encode()
+    writer = LogWriter(filename, **options)
+    if writer.version == 1:
+        stamps = (1000000000 + index / RATE for index in range(HOURS * 3600 * RATE))
+    else:
+        stamps = (writer.start + index * 1000000000 // RATE
+                  for index in range(HOURS * 3600 * RATE))
+    writer.clock = lambda: next(stamps)
+    for _ in range(HOURS * 3600 * RATE):
+        writer.logRead(frame)
+    writer.close()
+
+
+def query(filename, indexed):
+    reader = LogReader(filename)
+    if not indexed:
+        reader.index, reader.indexTimes = None, []
+    first = reader.read()[1]
+    start = time.time()
+    for _ in range(REPEAT):
+        count = sum(1 for _ in reader.readRange(first + QUERY, first + QUERY + 60))
+    return count, (time.time() - start) / REPEAT
+
+
+def main():
+    for name, options in (('v1', dict(version=1)),
+                          ('v2 zlib', dict(version=2, compression='zlib', index=True))):
+        generate(LOG, **options)
+        if not options.get('index'):
+            start = time.time()
+            buildIndex(LOG)
+            print('%s: buildIndex took %.2f s' % (name, time.time() - start))
+        print('%s: %.0f KB, index %.0f KB' % (name, os.path.getsize(LOG) / 1024,
+                                              os.path.getsize(LOG + INDEX_SUFFIX) / 1024))
+        for indexed in (False, True):
+            count, elapsed = query(LOG, indexed)
+            print('%s: %d records from %s in %8.2f ms'
+                  % (name, count, 'index' if indexed else 'top  ', elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Events per second and peak resident memory reading a large synthetic log
+with LogReader. The log holds RECORDS read records of one broadcast frame
+each, and is written first if it does not exist yet.
+
+"""
+
+from __future__ import division, print_function
+
+import os
+import resource
+import time
+
+import msgpack
+
+from ant.core import message
+from ant.core.log import EVENT_READ, LogReader
+
+LOG = '/tmp/python-ant.logread-bench.ant'
+RECORDS = 4000000
+
+
+def generate(filename):
+    packer = msgpack.Packer()
+    frame = message.ChannelBroadcastDataMessage(0, data=b'\x00' * 8).encode()
+    start = int(time.time())
+    with open(filename, 'wb') as fd:
+        fd.write(packer.pack(['ANT-LOG', 0x01]))
+        for index in range(RECORDS):
+            fd.write(packer.pack([EVENT_READ, start + index // 32, frame]))
+
+
+def peakRSS():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    if not os.path.exists(LOG):
+        generate(LOG)
+    size = os.path.getsize(LOG) / 1024 / 1024
+    before = peakRSS()
+    
+    start = time.time()
+    reader = LogReader(LOG)
+    count = 0
+    event = reader.read()
+    while event is not None:
+        count += 1
+        event = reader.read()
+    elapsed = time.time() - start
+    
+    print('%d events from %.0f MB: %.0f events/s, peak RSS %.0f MB (%.0f MB before)'
+          % (count, size, count / elapsed, peakRSS(), before))
+
+
+if __name__ == '__main__':
+    main()
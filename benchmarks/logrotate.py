@@ -0,0 +1,83 @@
+"""
+Cost of rotation to the thread logging. RECORDS broadcast frames are logged
+unthreaded, with fsync on close, into one file and then rotated every
+MAX_BYTES, timing each logRead() call and the calls that rotated on their
+own. For comparison, the time to create a file and fsync and close the last
+one inline is also timed. LogSet then reads the rotated files back as one
+stream.
+
+"""
+
+from __future__ import division, print_function
+
+import os
+import shutil
+import tempfile
+import time
+
+from ant.core import message
+from ant.core.log import FSYNC_CLOSE, LogSet, LogWriter, _Segment
+
+RECORDS = 200000
+MAX_BYTES = 256 * 1024
+
+
+def run(directory, **options):
+    frame = message.ChannelBroadcastDataMessage(0, data=b'\x00' * 8).encode()
+    log = LogWriter(os.path.join(directory, 'capture.ant'), fsync=FSYNC_CLOSE, **options)
+    timer = time.perf_counter
+    calls, rotations = [], []
+    for _ in range(RECORDS):
+        filename = log.filename
+        start = timer()
+        log.logRead(frame)
+        calls.append(timer() - start)
+        if log.filename != filename:
+            rotations.append(calls[-1])
+    log.close()
+    calls.sort()
+    return calls[len(calls) // 2], calls[-1], rotations
+
+
+def inline(directory, count=16):
+    # what a rotation costs when done in the logging thread
+    log = LogWriter(os.path.join(directory, 'inline.ant'))
+    last = log.segment
+    start = time.perf_counter()
+    for number in range(count):
+        segment = _Segment(log, os.path.join(directory, 'inline-%d.ant' % number))
+        last.close(fsync=True)
+        last = segment
+    elapsed = time.perf_counter() - start
+    last.close()
+    log.close()
+    return elapsed / count
+
+
+def main():
+    for name, options in (('one file', {}), ('rotated', dict(maxBytes=MAX_BYTES))):
+        directory = tempfile.mkdtemp()
+        try:
+            median, slowest, rotations = run(directory, **options)
+            files = len(os.listdir(directory))
+            start = time.time()
+            count = sum(1 for _ in LogSet(directory))
+            elapsed = time.time() - start
+        finally:
+            shutil.rmtree(directory)
+        print('%-8s %3d files  logRead median %5.2f us, max %7.1f us  LogSet %.0f records/s'
+              % (name, files, median * 1e6, slowest * 1e6, count / elapsed))
+        if rotations:
+            print('         rotating logRead mean %.1f us, max %.1f us'
+                  % (sum(rotations) / len(rotations) * 1e6, max(rotations) * 1e6))
+        assert count == RECORDS
+    
+    directory = tempfile.mkdtemp()
+    try:
+        print('inline rotation %.1f us' % (inline(directory) * 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
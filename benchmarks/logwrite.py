@@ -0,0 +1,67 @@
+"""
+Event pump throughput with capture logging off, written inline by the pump
+thread, and queued for a threaded LogWriter. A SimulatedDriver on its virtual
+clock feeds CHANNELS heart rate monitor channels through an EventMachine.
+
+"""
+
+from __future__ import division, print_function
+
+import time
+from threading import Event
+
+from ant.core import message
+from ant.core.constants import CHANNEL_TYPE_TWOWAY_RECEIVE
+from ant.core.event import EventCallback, EventMachine
+from ant.core.log import LogWriter
+from ant.core.simulator import HeartRateDevice, SimulatedDriver
+
+LOG = '/tmp/python-ant.logwrite-bench.ant'
+CHANNELS = 8
+MESSAGES = 200000
+
+
+class Counter(EventCallback):
+    def __init__(self, total):
+        self.count = 0
+        self.total = total
+        self.done = Event()
+    
+    def process(self, msg):
+        self.count += 1
+        if self.count == self.total:
+            self.done.set()
+
+
+def measure(log):
+    driver = SimulatedDriver([HeartRateDevice(number + 1) for number in range(CHANNELS)],
+                             realtime=False, maxChannels=CHANNELS, log=log)
+    evm = EventMachine(driver)
+    counter = Counter(MESSAGES)
+    evm.registerCallback(counter, message.ChannelBroadcastDataMessage.type)
+    evm.start()
+    try:
+        for number in range(CHANNELS):
+            for msg in (message.ChannelAssignMessage(number, CHANNEL_TYPE_TWOWAY_RECEIVE),
+                        message.ChannelIDMessage(number, number + 1, 120, 0),
+                        message.ChannelOpenMessage(number)):
+                evm.request(msg).result()
+        start = time.time()
+        counter.done.wait(120)
+        return MESSAGES / (time.time() - start)
+    finally:
+        evm.stop()
+        if log is not None:
+            log.close()
+
+
+def main():
+    print('no log    %8.0f messages/s' % measure(None))
+    print('inline    %8.0f messages/s' % measure(LogWriter(LOG)))
+    threaded = LogWriter(LOG, threaded=True, maxsize=65536)
+    print('threaded  %8.0f messages/s' % measure(threaded))
+    print('(threaded writer dropped %d records)' % threaded.dropped)
+
+
+if __name__ == '__main__':
+    main()
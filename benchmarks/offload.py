@@ -0,0 +1,96 @@
+"""
+Throughput of a CPU-heavy callback run inline on the dispatching thread
+versus offloaded to OffloadCallback worker processes, one per core. The
+handler keeps a rolling mean and deviation over a window of WORK samples per
+channel, recomputed from scratch on every message. "dispatch" is how fast
+the dispatching thread gets through the messages, "results" how fast the
+results come back.
+
+"""
+
+from __future__ import division, print_function
+
+import multiprocessing
+import time
+from collections import deque
+from threading import Event
+
+from ant.core import message
+from ant.core.event import EventMachine
+from ant.core.offload import OffloadCallback
+
+MESSAGES = 20000
+CHANNELS = 8
+WORK = 200
+
+
+class RollingStats(object):
+    def __init__(self):
+        self.windows = {}
+    
+    def process(self, msg):
+        payload = bytearray(msg.payload)
+        window = self.windows.setdefault(payload[0], deque(maxlen=WORK))
+        window.append(payload[1])
+        mean = sum(window) / len(window)
+        return mean, (sum((x - mean) ** 2 for x in window) / len(window)) ** 0.5
+
+
+class Inline(object):
+    def __init__(self, handler, results):
+        self.handler = handler
+        self.results = results
+    
+    def process(self, msg):
+        self.results(self.handler.process(msg))
+    
+    def flush(self):
+        pass
+    
+    def stop(self):
+        pass
+
+
+class Tally(object):
+    def __init__(self, total):
+        self.count = 0
+        self.total = total
+        self.done = Event()
+    
+    def __call__(self, result):
+        self.count += 1
+        if self.count == self.total:
+            self.done.set()
+
+
+def measure(factory):
+    messages = [message.ChannelBroadcastDataMessage(
+                    index % CHANNELS, data=bytearray((index % 256,)) + b'\x00' * 7)
+                for index in range(MESSAGES)]
+    tally = Tally(MESSAGES)
+    callback = factory(tally)
+    evm = EventMachine(None)
+    evm.registerCallback(callback)
+    try:
+        start = time.time()
+        evm.dispatch(messages)
+        dispatched = time.time() - start
+        callback.flush()
+        tally.done.wait(120)
+        return MESSAGES / dispatched, MESSAGES / (time.time() - start)
+    finally:
+        callback.stop()
+
+
+def main():
+    cores = multiprocessing.cpu_count()
+    print('%d messages, %d cores' % (MESSAGES, cores))
+    print('           dispatch      results')
+    print('inline    %8.0f/s  %8.0f/s' % measure(
+        lambda results: Inline(RollingStats(), results)))
+    print('offload   %8.0f/s  %8.0f/s' % measure(
+        lambda results: OffloadCallback(RollingStats(), results, workers=cores)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Event pump throughput and idle CPU through USB1Driver, with a pseudo terminal
+standing in for the stick's serial port. The simulated stick writes FRAMES
+broadcast frames in chunks of CHUNK frames, then goes quiet for IDLE seconds.
+
+"""
+
+from __future__ import division, print_function
+
+import os
+import time
+from threading import Event
+
+from ant.core import message
+from ant.core.driver import USB1Driver
+from ant.core.event import EventCallback, EventMachine
+
+FRAMES = 50000
+CHUNK = 16
+IDLE = 3.0
+
+
+class Counter(EventCallback):
+    def __init__(self, total):
+        self.count = 0
+        self.total = total
+        self.done = Event()
+    
+    def process(self, msg):
+        self.count += 1
+        if self.count == self.total:
+            self.done.set()
+
+
+def main():
+    master, slave = os.openpty()
+    frame = message.ChannelBroadcastDataMessage(0, data=b'\x00' * 8).encode()
+    chunk = frame * CHUNK
+    
+    counter = Counter(FRAMES)
+    evm = EventMachine(USB1Driver(os.ttyname(slave)))
+    evm.registerCallback(counter, messageType=frame[2])
+    evm.start()
+    try:
+        start = time.time()
+        for _ in range(FRAMES // CHUNK):
+            os.write(master, chunk)
+        counter.done.wait(60)
+        elapsed = time.time() - start
+        print('throughput: %.0f frames/s (%d of %d frames)'
+              % (counter.count / elapsed, counter.count, FRAMES))
+        
+        cpu = os.times()
+        time.sleep(IDLE)
+        used = sum(os.times()[:2]) - sum(cpu[:2])
+        print('idle: %.2f%% CPU' % (used / IDLE * 100))
+    finally:
+        evm.stop()
+        os.close(master)
+        os.close(slave)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Event pump throughput replaying a capture as fast as possible. Pass the path
+of a log recorded with LogWriter; without one, a capture of eight heart rate
+monitors is first recorded from a SimulatedDriver.
+
+"""
+
+from __future__ import division, print_function
+
+import sys
+import time
+
+from ant.core.event import EventCallback, EventMachine
+from ant.core.log import LogWriter
+from ant.core.node import Network, Node
+from ant.core.replay import ReplayDriver
+from ant.core.simulator import HeartRateDevice, SimulatedDriver
+
+CAPTURE = '/tmp/python-ant.replay-bench.ant'
+CHANNELS = 8
+SECONDS = 3600
+
+
+class Counter(EventCallback):
+    def __init__(self):
+        self.count = 0
+    
+    def process(self, msg):
+        self.count += 1
+
+
+def record(filename):
+    log = LogWriter(filename)
+    driver = SimulatedDriver([HeartRateDevice(number + 1) for number in range(CHANNELS)],
+                             realtime=False, maxChannels=CHANNELS, log=log)
+    node = Node(driver)
+    node.start()
+    try:
+        network = Network(key=b'\x00' * 8)
+        node.setNetworkKey(0, network)
+        node.configureChannels([(channel, dict(network=network,
+                                               channelID=(120, number + 1, 0),
+                                               open=True))
+                                for number, channel in enumerate(node.channels)])
+        while driver.clock < SECONDS:
+            time.sleep(0.05)
+    finally:
+        node.stop()
+        log.close()
+
+
+def main():
+    if len(sys.argv) > 1:
+        filename = sys.argv[1]
+    else:
+        filename = CAPTURE
+        record(filename)
+    
+    driver = ReplayDriver(filename, speed=None)
+    evm = EventMachine(driver)
+    counter = Counter()
+    evm.registerCallback(counter)
+    start = time.time()
+    evm.start()
+    driver.finished.wait()
+    elapsed = time.time() - start
+    evm.stop()
+    print('%d messages replayed, %.0f messages/s' % (counter.count, counter.count / elapsed))
+
+
+if __name__ == '__main__':
+    main()
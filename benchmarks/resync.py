@@ -0,0 +1,115 @@
+"""
+Feed randomly corrupted streams through FrameParser and report how many
+frames per second it recovers, how many intact frames it falsely dropped and
+how many bogus frames it let through. The byte-at-a-time resync EventPump
+used before FrameParser is run on the same streams for comparison.
+
+Usage: resync.py [frames] [corruption probability] [read size] [seed]
+
+"""
+
+from __future__ import division, print_function
+
+import random
+import sys
+import time
+from struct import pack, unpack_from
+
+from ant.core import message
+from ant.core.constants import MESSAGE_TX_SYNC
+from ant.core.exceptions import MessageError
+from ant.core.message import Message, FrameParser
+
+
+def build_stream(count, probability, rng):
+    frames, stream, intact = [], bytearray(), set()
+    for seq in range(count):
+        data = pack(b'<I', seq) + bytearray(rng.randrange(256) for _ in range(3))
+        frame = message.ChannelBroadcastDataMessage(seq % 8, data).encode()
+        frames.append(bytes(frame))
+        
+        if rng.random() < probability:
+            kind = rng.randrange(3)
+            if kind == 0:    # flipped byte
+                frame[rng.randrange(len(frame))] ^= 1 << rng.randrange(8)
+            elif kind == 1:  # lost bytes
+                cut = rng.randrange(len(frame))
+                del frame[cut:cut + rng.randrange(1, 4)]
+            else:            # line noise in front of the frame
+                noise = bytearray(rng.randrange(256) for _ in range(rng.randrange(1, 64)))
+                frame = noise + frame
+                intact.add(seq)
+        else:
+            intact.add(seq)
+        stream += frame
+    return frames, bytes(stream), intact
+
+
+def chunks(stream, readSize, rng):
+    offset = 0
+    while offset < len(stream):
+        size = rng.randrange(1, readSize + 1)
+        yield stream[offset:offset + size]
+        offset += size
+
+
+def legacy(pieces):
+    buffer_ = bytearray()
+    for data in pieces:
+        buffer_ += data
+        while len(buffer_) > 0:
+            try:
+                msg = Message.decode(buffer_)
+                yield msg
+                buffer_ = buffer_[len(msg):]
+            except MessageError as err:
+                if err.internal is not Message.INCOMPLETE:
+                    i, length = 1, len(buffer_)
+                    while i < length and buffer_[i] != MESSAGE_TX_SYNC:
+                        i += 1
+                    buffer_ = buffer_[i:]
+                else:
+                    break
+
+
+def parser(pieces):
+    parser_ = FrameParser()
+    for data in pieces:
+        for msg in parser_.feed(data):
+            yield msg
+
+
+def run(name, decoder, frames, stream, intact, readSize, seed):
+    pieces = list(chunks(stream, readSize, random.Random(seed)))
+    start = time.time()
+    decoded = list(decoder(pieces))
+    elapsed = time.time() - start
+    
+    recovered, bogus = set(), 0
+    for msg in decoded:
+        raw = bytes(msg.encode())
+        seq = unpack_from(b'<I', raw, 4)[0] if len(raw) == 12 else -1
+        if 0 <= seq < len(frames) and frames[seq] == raw:
+            recovered.add(seq)
+        else:
+            bogus += 1
+    
+    print('%-12s %10d %12.0f %10d %8d' % (name, len(recovered), len(recovered) / elapsed,
+                                        len(intact - recovered), bogus))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    probability = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    readSize = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    
+    frames, stream, intact = build_stream(count, probability, random.Random(seed))
+    print('%d frames, %d intact, %d bytes' % (count, len(intact), len(stream)))
+    print('%-12s %10s %12s %10s %8s' % ('', 'recovered', 'frames/s', 'dropped', 'bogus'))
+    run('byte walk', legacy, frames, stream, intact, readSize, seed)
+    run('FrameParser', parser, frames, stream, intact, readSize, seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+End-to-end receive throughput of a Node, from the driver through the event
+pump to channel callbacks. A SimulatedDriver on its virtual clock feeds
+CHANNELS channels, each tracking a heart rate monitor, as fast as the pump
+can take the traffic, so every run sees the same MESSAGES messages.
+
+"""
+
+from __future__ import division, print_function
+
+import time
+from threading import Event
+
+from ant.core.event import EventCallback
+from ant.core.node import Network, Node
+from ant.core.simulator import HeartRateDevice, SimulatedDriver
+
+CHANNELS = 8
+MESSAGES = 100000
+
+
+class Counter(EventCallback):
+    def __init__(self, total):
+        self.count = 0
+        self.total = total
+        self.done = Event()
+    
+    def process(self, msg, _channel):
+        self.count += 1
+        if self.count == self.total:
+            self.done.set()
+
+
+def main():
+    driver = SimulatedDriver([HeartRateDevice(number + 1) for number in range(CHANNELS)],
+                             realtime=False, maxChannels=CHANNELS)
+    node = Node(driver)
+    node.start()
+    try:
+        network = Network(key=b'\x00' * 8)
+        node.setNetworkKey(0, network)
+        counter = Counter(MESSAGES)
+        for channel in node.channels:
+            channel.registerCallback(counter)
+        
+        start = time.time()
+        node.configureChannels([(channel, dict(network=network,
+                                               channelID=(120, number + 1, 0),
+                                               open=True))
+                                for number, channel in enumerate(node.channels)])
+        counter.done.wait(120)
+        elapsed = time.time() - start
+        print('%d channels: %.0f messages/s (%d messages, %.1f s of traffic)'
+              % (CHANNELS, counter.count / elapsed, counter.count, driver.clock))
+    finally:
+        node.stop()
+
+
+if __name__ == '__main__':
+    main()
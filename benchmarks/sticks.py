@@ -0,0 +1,94 @@
+"""
+CPU used to receive from many sticks: one event pump thread per stick versus
+a single Reactor thread, with pseudo terminals standing in for the sticks'
+serial ports. A child process plays every stick, sending RATE broadcast
+frames a second on each for DURATION seconds; only the CPU of the receiving
+process is counted.
+
+"""
+
+from __future__ import division, print_function
+
+import os
+import time
+
+from ant.core import message
+from ant.core.driver import USB1Driver
+from ant.core.event import EventCallback, EventMachine
+from ant.core.reactor import Reactor
+
+STICKS = (1, 2, 4, 8, 10)
+RATE = 256
+BURST = 8
+DURATION = 3.0
+
+
+class Counter(EventCallback):
+    def __init__(self):
+        self.count = 0
+    
+    def process(self, msg):
+        self.count += 1
+
+
+def feed(masters):
+    frame = message.ChannelBroadcastDataMessage(0, data=b'\x00' * 8).encode()
+    burst = frame * BURST
+    interval = BURST / RATE
+    deadline = time.time()
+    end = deadline + DURATION
+    while deadline < end:
+        for master in masters:
+            os.write(master, burst)
+        deadline += interval
+        time.sleep(max(deadline - time.time(), 0))
+
+
+def measure(sticks, reactor):
+    ptys = [os.openpty() for _ in range(sticks)]
+    counter = Counter()
+    machines = [EventMachine(USB1Driver(os.ttyname(slave)), reactor)
+                for _, slave in ptys]
+    for evm in machines:
+        evm.registerCallback(counter)
+        evm.start()
+    
+    start = os.times()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            feed([master for master, _ in ptys])
+        finally:
+            os._exit(0)  # pylint: disable=protected-access
+    os.waitpid(pid, 0)
+    time.sleep(0.1)
+    end = os.times()
+    
+    for evm in machines:
+        evm.stop()
+    for master, slave in ptys:
+        os.close(master)
+        os.close(slave)
+    cpu = (end[0] - start[0]) + (end[1] - start[1])
+    return cpu / (end[4] - start[4]) * 100, counter.count
+
+
+def main():
+    print('%d frames/s per stick for %.0f s' % (RATE, DURATION))
+    print('sticks   threads CPU   reactor CPU')
+    for sticks in STICKS:
+        threaded, received = measure(sticks, None)
+        reactor = Reactor()
+        reactor.start()
+        try:
+            selected, received2 = measure(sticks, reactor)
+        finally:
+            reactor.stop()
+        expected = sticks * RATE * DURATION
+        assert received >= expected * 0.99 and received2 >= expected * 0.99, \
+               (received, received2, expected)
+        print('%6d   %10.1f%%   %10.1f%%' % (sticks, threaded, selected))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Latency of acknowledged data sent while other threads keep the stick busy
+with broadcast updates on CHANNELS channels, written straight to the driver
+versus through a TxScheduler. Every transfer costs TRANSFER seconds; the
+channels run at the default 4 Hz period.
+
+"""
+
+from __future__ import division, print_function
+
+import time
+from threading import Event, Thread
+
+from ant.core import message
+from ant.core.driver import Driver
+from ant.core.scheduler import TxScheduler
+
+CHANNELS = 8
+ACKNOWLEDGED = 50
+TRANSFER = 0.001
+
+
+class SlowDriver(Driver):
+    def __init__(self):
+        super(SlowDriver, self).__init__()
+        self.transfers = 0
+        self._isOpen = False
+    
+    @property
+    def _opened(self):
+        return self._isOpen
+    
+    def _open(self):
+        self._isOpen = True
+    
+    def _close(self):
+        self._isOpen = False
+    
+    def _write(self, data):
+        self.transfers += 1
+        time.sleep(TRANSFER)
+        return len(data)
+
+
+def measure(scheduled):
+    driver = SlowDriver()
+    driver.open()
+    scheduler = None
+    if scheduled:
+        scheduler = TxScheduler()
+        scheduler.start(driver)
+    target = scheduler or driver
+    done = Event()
+    
+    def update(number):
+        msg = message.ChannelBroadcastDataMessage(number, data=b'\x00' * 8)
+        while not done.is_set():
+            if scheduled:
+                target.submit(msg)
+            else:
+                target.write(msg)
+            time.sleep(0.0005)
+    
+    updaters = [Thread(target=update, args=(number,)) for number in range(1, CHANNELS + 1)]
+    for thread in updaters:
+        thread.start()
+    
+    latencies = []
+    msg = message.ChannelAcknowledgedDataMessage(0, data=b'\x00' * 8)
+    start = time.time()
+    for _ in range(ACKNOWLEDGED):
+        sent = time.time()
+        target.write(msg)
+        latencies.append((time.time() - sent) * 1e3)
+        time.sleep(0.005)
+    elapsed = time.time() - start
+    
+    done.set()
+    for thread in updaters:
+        thread.join()
+    if scheduler is not None:
+        scheduler.stop()
+    driver.close()
+    latencies.sort()
+    return (latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)],
+            driver.transfers / elapsed)
+
+
+def main():
+    print('%d channels updating, %.1f ms per transfer' % (CHANNELS, TRANSFER * 1e3))
+    print('           ack median ms   ack p95 ms   transfers/s')
+    for scheduled in (False, True):
+        name = 'scheduler' if scheduled else 'direct'
+        print('%-10s %13.2f %12.2f %13.0f' % ((name,) + measure(scheduled)))
+
+
+if __name__ == '__main__':
+    main()
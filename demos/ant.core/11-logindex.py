@@ -0,0 +1,16 @@
+"""
+Build the index of an ANT-LOG file written without one, so that
+LogReader.seek() and LogReader.readRange() need not read it from the top.
+
+"""
+
+import sys
+
+from ant.core import log
+
+if len(sys.argv) != 2:
+    print("Usage: {0} file.ant".format(sys.argv[0]))
+    sys.exit()
+
+count = log.buildIndex(sys.argv[1])
+print("{0} checkpoints written to {1}{2}".format(count, sys.argv[1], log.INDEX_SUFFIX))
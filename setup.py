@@ -58,9 +58,12 @@ setup(
     packages=find_packages('src'),
     package_dir={'': 'src'},
     install_requires=[
-        'pyserial',
+        'pyserial>=3',
         'pyusb>=1.0.0b2',
         'msgpack-python',
         'six>=1.7.0',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
 )
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring, invalid-name
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+#
+# asyncio front-end for ant.core.node (Python 3 only). Commands are written
+# from the calling coroutine and their replies are handed back to the event
+# loop by the event pump through loop.call_soon_threadsafe, so no executor
+# threads are involved.
+#
+
+import asyncio
+
+from ant.core import message
+from ant.core.constants import (EVENT_CHANNEL_CLOSED, MESSAGE_CAPABILITIES,
+                                RESPONSE_NO_ERROR)
+from ant.core.event import EventCallback, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST
+from ant.core.exceptions import ChannelError, MessageError, NodeError
+from ant.core.node import Device, Node
+
+
+def _resolve(future, msg):
+    if not future.done():
+        future.set_result(msg)
+
+
+# A reply we are expecting; the waiter is registered right away, before the
+# command that triggers it is written.
+class _Reply(object):
+    def __init__(self, mailbox, foo):  # pylint: disable=blacklisted-name
+        loop = asyncio.get_running_loop()
+        self.mailbox = mailbox
+        self.foo = foo
+        self.future = future = loop.create_future()
+        self.waiter = mailbox.expect(
+            foo, lambda msg: loop.call_soon_threadsafe(_resolve, future, msg))
+    
+    async def wait(self, timeout):
+        try:
+            return await asyncio.wait_for(self.future, timeout)
+        except asyncio.TimeoutError:
+            raise MessageError("%s: timeout" % str(self.foo), internal=self.foo)
+        finally:
+            self.mailbox.cancel(self.waiter)
+    
+    def cancel(self):
+        self.mailbox.cancel(self.waiter)
+        self.future.cancel()
+
+
+# A channel's messages as an async iterator, from AsyncChannel.messages().
+# This is not backpressure: the pump never waits for the consumer, as it
+# holds the callback lock and feeds every other listener. Once maxsize
+# messages are queued, overflow says whether the new message is dropped
+# (OVERFLOW_DROP_NEWEST) or the oldest queued one (OVERFLOW_DROP_OLDEST);
+# either way it is counted in dropped. Close the stream, or use it in an
+# async with, to stop it listening.
+class MessageStream(EventCallback):
+    def __init__(self, channel, maxsize=64, overflow=OVERFLOW_DROP_NEWEST):
+        if overflow not in (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST):
+            raise ValueError('unknown overflow policy: %r' % (overflow,))
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflow = overflow
+        self.dropped = 0
+        self.closed = False
+        channel.registerCallback(self)
+    
+    def process(self, msg, _channel):
+        if not self.closed:
+            self.loop.call_soon_threadsafe(self._put, msg)
+    
+    def _put(self, msg):
+        # on the event loop, so dropped is only ever touched from there
+        queue = self.queue
+        if queue.full():
+            self.dropped += 1
+            if self.overflow == OVERFLOW_DROP_NEWEST:
+                return
+            queue.get_nowait()
+        queue.put_nowait(msg)
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        if self.closed:
+            raise StopAsyncIteration()
+        return await self.queue.get()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.close()
+    
+    async def aclose(self):
+        self.close()
+    
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.channel.removeCallback(self)
+
+
+class AsyncChannel(object):
+    def __init__(self, node, channel):
+        self.node = node
+        self.channel = channel
+    
+    number = property(lambda self: self.channel.number)
+    
+    async def _command(self, msg, what):
+        try:
+            await self.node.command(msg)
+        except MessageError as err:
+            raise ChannelError('%s: could not %s: %s' % (self.channel, what, err))
+    
+    # pylint: disable=protected-access
+    async def assign(self, network, channelType):
+        msg = message.ChannelAssignMessage(self.number, channelType, network.number)
+        await self._command(msg, 'assign')
+        self.channel.type = channelType
+        self.channel.network = network
+    
+    async def setID(self, devType, devNum, transType):
+        msg = message.ChannelIDMessage(self.number, devNum, devType, transType)
+        await self._command(msg, 'set ID')
+        self.channel.device = Device(devNum, devType, transType)
+    
+    async def setSearchTimeout(self, timeout):
+        msg = message.ChannelSearchTimeoutMessage(self.number, timeout)
+        await self._command(msg, 'set search timeout')
+        self.channel._searchTimeout = timeout
+    
+    async def setPeriod(self, counts):
+        msg = message.ChannelPeriodMessage(self.number, counts)
+        await self._command(msg, 'set period')
+        self.channel._period = counts
+    
+    async def setFrequency(self, frequency):
+        msg = message.ChannelFrequencyMessage(self.number, frequency)
+        await self._command(msg, 'set frequency')
+        self.channel._frequency = frequency
+    # pylint: enable=protected-access
+    
+    async def open(self):
+        await self._command(message.ChannelOpenMessage(number=self.number), 'open')
+        self.node.evm.registerCallback(self.channel, channelNumber=self.number)
+    
+    async def close(self):
+        node, evm = self.node, self.node.evm
+        closed = _Reply(evm.msg, message.ChannelEventResponseMessage)
+        try:
+            await self._command(message.ChannelCloseMessage(number=self.number), 'close')
+        except ChannelError:
+            closed.cancel()
+            raise
+        while True:
+            msg = await closed.wait(node.timeout)
+            if msg.channelNumber == self.number and msg.messageCode == EVENT_CHANNEL_CLOSED:
+                break
+            closed = _Reply(evm.msg, message.ChannelEventResponseMessage)
+        evm.removeCallback(self.channel)
+    
+    async def unassign(self):
+        await self._command(message.ChannelUnassignMessage(number=self.number), 'unassign')
+        self.channel.network = None
+    
+    def registerCallback(self, callback):
+        self.channel.registerCallback(callback)
+    
+    def messages(self, maxsize=64, overflow=OVERFLOW_DROP_NEWEST):
+        return MessageStream(self.channel, maxsize, overflow)
+
+
+class AsyncNode(object):
+    def __init__(self, driver, name=None, timeout=10):
+        self.node = Node(driver, name)
+        self.timeout = timeout
+        self.channels = []
+    
+    evm = property(lambda self: self.node.evm)
+    running = property(lambda self: self.node.running)
+    
+    async def _send(self, msg, mailbox, foo):  # pylint: disable=blacklisted-name
+        reply = _Reply(mailbox, foo)
+        try:
+            self.evm.writeMessage(msg)
+        except Exception:
+            reply.cancel()
+            raise
+        return await reply.wait(self.timeout)
+    
+    async def command(self, msg):
+        response = (await self._send(msg, self.evm.ack, msg)).messageCode
+        if response != RESPONSE_NO_ERROR:
+            raise MessageError("bad response code (%.2x)" % response,
+                               internal=(msg, response))
+    
+    async def request(self, msg, class_):
+        return await self._send(msg, self.evm.msg, class_)
+    
+    async def reset(self, wait=True):
+        msg = message.SystemResetMessage()
+        if wait:
+            await self.request(msg, message.StartupMessage)
+        else:
+            self.evm.writeMessage(msg)
+    
+    async def start(self, wait=True):
+        node = self.node
+        if node.running:
+            raise NodeError('Could not start ANT node (already started).')
+        
+        node.evm.start(name=node.name)
+        try:
+            await self.reset(wait)
+            msg = message.ChannelRequestMessage(messageID=MESSAGE_CAPABILITIES)
+            caps = await self.request(msg, message.CapabilitiesMessage)
+        except MessageError as err:
+            self.stop()
+            raise NodeError(err)
+        
+        node._setCapabilities(caps)  # pylint: disable=protected-access
+        self.channels = [AsyncChannel(self, channel) for channel in node.channels]
+    
+    def stop(self):
+        self.node.stop()
+    
+    async def setNetworkKey(self, number, network=None):
+        networks = self.node.networks
+        if network is None:
+            network = networks[number]
+        else:
+            networks[number] = network
+        
+        try:
+            await self.command(message.NetworkKeyMessage(number, network.key))
+        except MessageError as err:
+            raise NodeError("could not set network key '%d': %s" % (number, err))
+        
+        network.number = number
+    
+    def getFreeChannel(self):
+        return self.channels[self.node.getFreeChannel().number]
+    
+    def registerEventListener(self, callback, messageType=None, channelNumber=None):
+        self.node.registerEventListener(callback, messageType, channelNumber)
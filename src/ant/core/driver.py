@@ -26,7 +26,8 @@
 
 from __future__ import division, absolute_import, print_function, unicode_literals
 
-from threading import Lock
+from collections import deque
+from threading import Condition, Event, Lock, Thread
 
 # USB1 driver uses a USB<->Serial bridge
 from serial import Serial, SerialException, SerialTimeoutException
@@ -39,11 +40,49 @@ from usb.util import (find_descriptor, claim_interface, release_interface,
 from ant.core.exceptions import DriverError
 
 
+# Completion of a frame handed to Driver.submit.
+class PendingWrite(object):
+    def __init__(self, data):
+        self.data = data
+        self.count = None
+        self.error = None
+        self.event = Event()
+        self.failed = None  # called on error
+    
+    def done(self):
+        return self.event.is_set()
+    
+    def complete(self, count=None, error=None):
+        self.count = count
+        self.error = error
+        self.event.set()
+        if error is not None and self.failed is not None:
+            self.failed()
+    
+    def wait(self, timeout=None):
+        if not self.event.wait(timeout):
+            raise DriverError("Could not write to device (timeout).")
+        if self.error is not None:
+            raise self.error
+        return self.count
+
+
 class Driver(object):
-    def __init__(self, log=None, debug=False):
+    # most the event pump asks for in one read
+    readSize = 20
+    # most a coalescing writer puts in one transfer
+    writeSize = 64
+    
+    def __init__(self, log=None, debug=False, coalesce=False):
         self.debug = debug
         self.log = log
+        self.coalesce = coalesce
         self._lock = Lock()
+        self._writeLock = Lock()
+        self._pending = deque()
+        self._pendingCond = Condition()
+        self._writer = None
+        self._stopping = False
     
     def open(self):
         with self._lock:
@@ -53,6 +92,12 @@ class Driver(object):
             self._open()
             if self.log:
                 self.log.logOpen()
+        
+        if self.coalesce:
+            self._stopping = False
+            self._writer = writer = Thread(target=self._writeQueued, name='ant-writer')
+            writer.daemon = True
+            writer.start()
     
     @property
     def opened(self):
@@ -60,6 +105,15 @@ class Driver(object):
             return self._opened
     
     def close(self):
+        writer = self._writer
+        if writer is not None:
+            # frames already submitted still go out; the writer thread lets
+            # go of _writer itself once they have, see _writeQueued
+            with self._pendingCond:
+                self._stopping = True
+                self._pendingCond.notify()
+            writer.join()
+        
         with self._lock:
             if not self._opened:
                 raise DriverError("Could not close device (not open).")
@@ -84,24 +138,90 @@ class Driver(object):
         return data
     
     def write(self, msg):
+        if self._writer is not None:
+            return self.submit(msg).wait()
         if not self.opened:
             raise DriverError("Could not write to device (not open).")
         
-        data = msg.encode()
-        ret = self._write(data)
-        
+        # pre-encoded frames are written as they are
+        data = msg if isinstance(msg, (bytes, bytearray)) else msg.encode()
+        with self._writeLock:
+            ret = self._write(data)
+        self._written(data, ret)
+        return ret
+    
+    def submit(self, msg):
+        # queues the frame for the writer thread, or writes it right away
+        # when there is none; a copy is queued, as the caller may change its
+        # buffer meanwhile (FrameTemplate.encode() hands out its own)
+        data = bytes(msg if isinstance(msg, (bytes, bytearray)) else msg.encode())
+        pending = PendingWrite(data)
+        with self._pendingCond:
+            if self._writer is not None:
+                self._pending.append(pending)
+                self._pendingCond.notify()
+                return pending
+        try:
+            pending.complete(self.write(data))
+        except DriverError as err:
+            pending.complete(error=err)
+        return pending
+    
+    def _written(self, data, ret):
         with self._lock:
             if self.debug:
-                self._dump(str(data), 'W')
+                self._dump(data, 'W')
             if self.log:
                 self.log.logWrite(data[0:ret])
-        return ret
+    
+    def _writeQueued(self):
+        # Frames queued while a transfer is under way go out together in the
+        # next one, as many as fit in writeSize, in the order they came in.
+        cond, queue = self._pendingCond, self._pending
+        while True:
+            with cond:
+                while not queue and not self._stopping:
+                    cond.wait()
+                if not queue:
+                    # from here on writes are made by whoever asks for them
+                    self._writer = None
+                    return
+                batch = [queue.popleft()]
+                size = len(batch[0].data)
+                while queue and size + len(queue[0].data) <= self.writeSize:
+                    size += len(queue[0].data)
+                    batch.append(queue.popleft())
+            
+            data = b''.join(pending.data for pending in batch)
+            try:
+                ret = self._write(data)
+            except Exception as err:  # pylint: disable=broad-except
+                if not isinstance(err, DriverError):
+                    err = DriverError(str(err))
+                for pending in batch:
+                    pending.complete(error=err)
+                continue
+            self._written(data, ret)
+            
+            offset = 0
+            for pending in batch:
+                length = len(pending.data)
+                if offset + length <= ret:
+                    pending.complete(length)
+                else:
+                    pending.complete(error=DriverError(
+                        "Could not write to device (short write)."))
+                offset += length
     
     @staticmethod
     def _dump(data, title):
         if len(data) == 0:
             return
-        print('%s:  ' % title, *('%02X' % ord(byte) for byte in data))
+        print('%s:  ' % title, *('%02X' % byte for byte in bytearray(data)))
+    
+    def fileno(self):
+        # for drivers that can be waited on with select, see ant.core.reactor
+        raise NotImplementedError()
     
     @property
     def _opened(self):
@@ -121,10 +241,15 @@ class Driver(object):
 
 
 class USB1Driver(Driver):
-    def __init__(self, device, baudRate=115200, log=None, debug=False):
-        super(USB1Driver, self).__init__(log=log, debug=debug)
+    # a cap; a read returns whatever the serial port has buffered
+    readSize = 4096
+    
+    def __init__(self, device, baudRate=115200, log=None, debug=False, timeout=0.1,
+                 coalesce=False):
+        super(USB1Driver, self).__init__(log=log, debug=debug, coalesce=coalesce)
         self.device = device
         self.baud = baudRate
+        self.timeout = timeout
         self._serial = None
     
     def _open(self):
@@ -137,7 +262,7 @@ class USB1Driver(Driver):
             raise DriverError("Could not open device")
         
         self._serial = dev
-        dev.timeout = 0.01
+        dev.timeout = self.timeout
     
     @property
     def _opened(self):
@@ -146,8 +271,18 @@ class USB1Driver(Driver):
     def _close(self):
         self._serial.close()
     
+    def fileno(self):
+        return self._serial.fileno()
+    
     def _read(self, count):
-        return self._serial.read(count)
+        # block for the first byte, then take the rest of what has arrived
+        serial = self._serial
+        data = serial.read(1)
+        if data:
+            waiting = min(serial.in_waiting, count - 1)
+            if waiting > 0:
+                data += serial.read(waiting)
+        return data
     
     def _write(self, data):
         try:
@@ -161,10 +296,12 @@ class USB1Driver(Driver):
 
 class USB2Driver(Driver):
     
-    def __init__(self, idVendor=0x0fcf, idProduct=0x1008, log=None, debug=False):
-        super(USB2Driver, self).__init__(log=log, debug=debug)
+    def __init__(self, idVendor=0x0fcf, idProduct=0x1008, log=None, debug=False,
+                 timeout=0.1, coalesce=False):
+        super(USB2Driver, self).__init__(log=log, debug=debug, coalesce=coalesce)
         self.idVendor = idVendor
         self.idProduct = idProduct
+        self.timeout = timeout
         
         self._epOut = None
         self._epIn = None
@@ -207,6 +344,9 @@ class USB2Driver(Driver):
         
         self._epOut = epOut
         self._epIn = ep_in
+        # one full bulk packet per read or coalesced write
+        self.readSize = ep_in.wMaxPacketSize
+        self.writeSize = epOut.wMaxPacketSize
         self._dev = dev
         self._intNum = interfaceNumber
     
@@ -223,7 +363,8 @@ class USB2Driver(Driver):
         self._epOut = self._epIn = None
     
     def _read(self, count):
-        return self._epIn.read(count).tostring()
+        data = self._epIn.read(count, int(self.timeout * 1000))
+        return data.tobytes() if hasattr(data, 'tobytes') else data.tostring()
     
     def _write(self, data):
         return self._epOut.write(data)
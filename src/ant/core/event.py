@@ -30,53 +30,36 @@
 
 from __future__ import division, absolute_import, print_function, unicode_literals
 
-from time import sleep, time
-from threading import Lock, Thread
+from collections import deque
+from threading import Condition, Event, Lock, Thread, current_thread
+from time import time
 
-from ant.core.constants import MESSAGE_TX_SYNC, RESPONSE_NO_ERROR
-from ant.core.message import Message, ChannelEventResponseMessage
+from ant.core.constants import MESSAGE_CHANNEL_EVENT, RESPONSE_NO_ERROR
+from ant.core.message import (CapabilitiesMessage, ChannelEventResponseMessage,
+                              ChannelIDMessage, ChannelMessage, ChannelStatusMessage,
+                              FrameParser, FrameTemplate, MessageType,
+                              NetworkKeyMessage, SerialNumberMessage, StartupMessage,
+                              VersionMessage)
 from ant.core.exceptions import MessageError
 from usb.core import USBError
 
 
 def EventPump(evm):
-    buffer_ = b''
-    while True:
-        with evm.runningLock:
-            if not evm.running:
-                break
-        
+    parser = FrameParser()
+    driver = evm.driver
+    # the driver's read timeout is what paces an idle pump; reading the flag
+    # needs no lock, stop() only ever clears it
+    while evm.running:
         try:
-            buffer_ += evm.driver.read(20)
+            data = driver.read(driver.readSize)
         except USBError as e:
             if e.errno in (60, 110):  # timeout
                 continue
             else:
                 raise
         
-        messages = []
-        while len(buffer_) > 0:
-            try:
-                msg = Message.decode(buffer_)
-                messages.append(msg)
-                buffer_ = buffer_[len(msg):]
-            except MessageError as err:
-                if err.internal is not Message.INCOMPLETE:
-                    i, length = 1, len(buffer_)
-                    # move to the next SYNC byte
-                    while i < length and ord(buffer_[i]) != MESSAGE_TX_SYNC:
-                        i += 1
-                    buffer_ = buffer_[i:]
-                else:
-                    break
-        
-        with evm.evmCallbackLock:
-            for message in messages:
-                for callback in evm.callbacks:
-                    try:
-                        callback.process(message)
-                    except Exception as err:  # pylint: disable=broad-except
-                        print(err)
+        if data:
+            evm.dispatch(parser.feed(data))
 
 
 class EventCallback(object):
@@ -85,36 +68,238 @@ class EventCallback(object):
         raise NotImplementedError()
 
 
+OVERFLOW_DROP_OLDEST = 'drop-oldest'
+OVERFLOW_DROP_NEWEST = 'drop-newest'
+OVERFLOW_BLOCK = 'block'
+
+
+# Delivers to the wrapped callback from its own worker thread through a
+# bounded queue, so a slow consumer cannot hold up the event pump.
+class QueuedCallback(EventCallback):
+    def __init__(self, callback, maxsize=256, overflow=OVERFLOW_DROP_OLDEST, name=None):
+        if overflow not in (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_BLOCK):
+            raise ValueError('unknown overflow policy: %r' % (overflow,))
+        self.callback = callback
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.queue = deque()
+        self.cond = Condition()
+        self.running = True
+        self.dropped = 0
+        self.processed = 0
+        self.latency = 0.0
+        self.maxLatency = 0.0
+        
+        self.thread = thread = Thread(target=self._run, name=name)
+        thread.daemon = True
+        thread.start()
+    
+    def process(self, *args):
+        cond, queue = self.cond, self.queue
+        with cond:
+            if not self.running:
+                return
+            if len(queue) >= self.maxsize:
+                if self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                elif self.overflow == OVERFLOW_DROP_OLDEST:
+                    queue.popleft()
+                    self.dropped += 1
+                else:
+                    while len(queue) >= self.maxsize and self.running:
+                        cond.wait()
+                    if not self.running:
+                        return
+            queue.append((time(), args))
+            cond.notify_all()
+    
+    def stop(self):
+        # whatever is already queued is still delivered
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread is not current_thread():
+            self.thread.join()
+    
+    @property
+    def stats(self):
+        with self.cond:
+            processed = self.processed
+            return {'depth': len(self.queue), 'dropped': self.dropped,
+                    'processed': processed, 'maxLatency': self.maxLatency,
+                    'latency': self.latency / processed if processed else 0.0}
+    
+    def _run(self):
+        cond, queue = self.cond, self.queue
+        while True:
+            with cond:
+                while not queue and self.running:
+                    cond.wait()
+                if not queue:
+                    return
+                queued, args = queue.popleft()
+                cond.notify_all()
+            
+            try:
+                self.callback.process(*args)
+            except Exception as err:  # pylint: disable=broad-except
+                print(err)
+            
+            latency = time() - queued
+            with cond:
+                self.processed += 1
+                self.latency += latency
+                self.maxLatency = max(self.maxLatency, latency)
+
+
+class Waiter(object):
+    def __init__(self, key, callback=None):
+        self.key = key
+        self.callback = callback
+        self.message = None
+        self.event = Event()
+    
+    def deliver(self, msg):
+        self.message = msg
+        self.event.set()
+        if self.callback is not None:
+            self.callback(msg)
+    
+    def wait(self, timeout=None):
+        self.event.wait(timeout)
+        return self.message
+
+
+# Messages are filed by key: a message goes straight to the oldest waiter for
+# its key, or else into that key's mailbox, a ring of the last MAX_QUEUE
+# messages. Only keys someone subscribed to have a mailbox; anything else
+# nobody is waiting for is dropped on arrival.
 class EventMachineCallback(EventCallback):
     MAX_QUEUE = 25
-    WAIT_UNTIL = staticmethod(lambda _,__:None)
     
-    def __init__(self):
-        self.messages = []
+    def __init__(self, subscriptions=()):
+        self.mailboxes = {}
+        self.waiters = {}
         self.lock = Lock()
+        for foo in subscriptions:  # pylint: disable=blacklisted-name
+            self.subscribe(foo)
+    
+    @staticmethod
+    def _key(foo):  # pylint: disable=blacklisted-name
+        raise NotImplementedError()
+    
+    @staticmethod
+    def _keys(msg):
+        # keys an incoming message answers to, most specific first
+        raise NotImplementedError()
+    
+    def _mailbox(self, key):
+        return self.mailboxes.get(key)
+    
+    def _claim(self, key):
+        mailbox = self.mailboxes.get(key)
+        return mailbox.popleft() if mailbox else None
+    
+    def subscribe(self, foo):  # pylint: disable=blacklisted-name
+        with self.lock:
+            key = self._key(foo)
+            if key not in self.mailboxes:
+                self.mailboxes[key] = deque(maxlen=self.MAX_QUEUE)
+    
+    def unsubscribe(self, foo):  # pylint: disable=blacklisted-name
+        with self.lock:
+            self.mailboxes.pop(self._key(foo), None)
     
     def process(self, msg):
+        keys = self._keys(msg)
+        with self.lock:
+            waiters = self.waiters
+            for key in keys:
+                queue = waiters.get(key)
+                if queue:
+                    waiter = queue.popleft()
+                    if not queue:
+                        del waiters[key]
+                    waiter.deliver(msg)
+                    return
+            
+            for key in keys:
+                mailbox = self._mailbox(key)
+                if mailbox is not None:
+                    mailbox.append(msg)
+                    return
+    
+    def expect(self, foo, callback=None):  # pylint: disable=blacklisted-name
+        key = self._key(foo)
+        waiter = Waiter(key, callback)
         with self.lock:
-            messages = self.messages
-            messages.append(msg)
-            MAX_QUEUE = self.MAX_QUEUE
-            if len(messages) > MAX_QUEUE:
-                self.messages = messages[-MAX_QUEUE:]
+            msg = self._claim(key)
+            if msg is not None:
+                waiter.deliver(msg)
+            else:
+                self.waiters.setdefault(key, deque()).append(waiter)
+        return waiter
+    
+    def cancel(self, waiter):
+        with self.lock:
+            queue = self.waiters.get(waiter.key)
+            if queue is None:
+                return
+            try:
+                queue.remove(waiter)
+            except ValueError:
+                return
+            if not queue:
+                del self.waiters[waiter.key]
     
     def waitFor(self, foo, timeout=10):  # pylint: disable=blacklisted-name
-        messages = self.messages
-        basetime = time()
-        while time() - basetime < timeout:
-            with self.lock:
-                for emsg in messages:
-                    if self.WAIT_UNTIL(foo, emsg):
-                        messages.remove(emsg)
-                        return emsg
-            sleep(0.001)
-        raise MessageError("%s: timeout" % str(foo), internal=foo)
+        waiter = self.expect(foo)
+        if waiter.wait(timeout) is None:
+            self.cancel(waiter)
+            # it may have been delivered while we were giving up on it
+            if waiter.message is None:
+                raise MessageError("%s: timeout" % str(foo), internal=foo)
+        return waiter.message
+
+
+# The stick answers a command on the channel (or network) it was about, so
+# (number, message ID) tells apart acks for the same command on different
+# channels. Other commands are matched on their message ID alone.
+def ackKey(msg):
+    if isinstance(msg, ChannelMessage):
+        return msg.channelNumber, msg.type
+    elif isinstance(msg, NetworkKeyMessage):
+        return msg.number, msg.type
+    elif isinstance(msg, FrameTemplate):
+        return msg.number, msg.type
+    return None, msg.type
 
+
+# Acks are only ever sent in reply to our own commands, so they are all kept.
 class AckCallback(EventMachineCallback):
-    WAIT_UNTIL = staticmethod(lambda msg, emsg: msg.type == emsg.messageID)
+    _key = staticmethod(ackKey)
+    
+    @staticmethod
+    def _keys(msg):
+        messageID = msg.messageID
+        return (msg.channelNumber, messageID), (None, messageID)
+    
+    def _mailbox(self, key):
+        mailbox = self.mailboxes.get(key)
+        if mailbox is None:
+            mailbox = self.mailboxes[key] = deque(maxlen=self.MAX_QUEUE)
+        return mailbox
+    
+    def _claim(self, key):
+        number, messageID = key
+        if number is not None:
+            return super(AckCallback, self)._claim(key)
+        # rare: a command that is not about a channel or network
+        for (_, retainedID), mailbox in self.mailboxes.items():
+            if retainedID == messageID and mailbox:
+                return mailbox.popleft()
+        return None
     
     def process(self, msg):
         if isinstance(msg, ChannelEventResponseMessage) and \
@@ -122,14 +307,89 @@ class AckCallback(EventMachineCallback):
             super(AckCallback, self).process(msg)
 
 
+# A message class is filed under its message ID. An untyped base class such as
+# ChannelMessage is filed under itself and, as before mailboxes, answers to
+# every message derived from it; messages are only looked up by their base
+# classes once someone has asked for one.
 class MsgCallback(EventMachineCallback):
-    WAIT_UNTIL = staticmethod(lambda class_, emsg: isinstance(emsg, class_))
+    def __init__(self, subscriptions=()):
+        self.bases = None
+        super(MsgCallback, self).__init__(subscriptions)
+    
+    def _key(self, class_):
+        if class_.typed:
+            return class_.type
+        if self.bases is None:
+            self.bases = {}
+        return class_
+    
+    def _keys(self, msg):
+        if self.bases is None:
+            return (msg.type,)
+        cls = msg.__class__
+        bases = self.bases.get(cls)
+        if bases is None:
+            bases = self.bases[cls] = tuple(
+                base for base in cls.__mro__
+                if isinstance(base, MessageType) and not base.typed)
+        return (msg.type,) + bases
+    
+    def _claim(self, key):
+        if not isinstance(key, MessageType):
+            return super(MsgCallback, self)._claim(key)
+        # rare: the message may be waiting in the mailbox of a derived class
+        for mailbox in self.mailboxes.values():
+            for i, msg in enumerate(mailbox):
+                if isinstance(msg, key):
+                    del mailbox[i]
+                    return msg
+        return None
+
+
+# Handle on a command whose ack has not been collected yet.
+class Request(object):
+    def __init__(self, mailbox, msg):
+        self.mailbox = mailbox
+        self.msg = msg
+        self.waiter = mailbox.expect(msg)
+        self.write = None
+    
+    def done(self):
+        return self.waiter.event.is_set()
+    
+    def cancel(self):
+        self.mailbox.cancel(self.waiter)
+    
+    def result(self, timeout=10):
+        msg, waiter = self.msg, self.waiter
+        waiter.wait(timeout)
+        if waiter.message is None:
+            self.cancel()
+            # it may have been delivered while we were giving up on it
+            if waiter.message is None:
+                error = self.write is not None and self.write.error or 'timeout'
+                raise MessageError("%s: %s" % (msg, error), internal=msg)
+        response = waiter.message.messageCode
+        if response != RESPONSE_NO_ERROR:
+            raise MessageError("bad response code (%.2x)" % response,
+                               internal=(msg, response))
+        return waiter.message
+
+
+# replies that may come back before anyone gets round to waiting for them
+REPLIES = (StartupMessage, CapabilitiesMessage, VersionMessage, SerialNumberMessage,
+           ChannelStatusMessage, ChannelIDMessage, ChannelEventResponseMessage)
 
 
 class EventMachine(object):
-    def __init__(self, driver):
+    def __init__(self, driver, reactor=None, scheduler=None):
         self.driver = driver
-        self.callbacks = set()
+        # with a reactor the driver is read from its thread, not our own pump
+        self.reactor = reactor
+        # with a scheduler writes are queued and ordered by it
+        self.scheduler = scheduler
+        # {messageType: {channelNumber: set(callbacks)}}, None matches any
+        self.callbacks = {}
         self.eventPump = None
         self.running = False
         
@@ -137,25 +397,74 @@ class EventMachine(object):
         self.runningLock = Lock()
         
         self.ack = ack = AckCallback()
-        self.msg = msg = MsgCallback()
-        self.registerCallback(ack)
+        self.msg = msg = MsgCallback(REPLIES)
+        self.registerCallback(ack, messageType=MESSAGE_CHANNEL_EVENT)
         self.registerCallback(msg)
     
-    def registerCallback(self, callback):
+    def registerCallback(self, callback, messageType=None, channelNumber=None):
         with self.evmCallbackLock:
-            self.callbacks.add(callback)
+            channels = self.callbacks.setdefault(messageType, {})
+            channels.setdefault(channelNumber, set()).add(callback)
     
     def removeCallback(self, callback):
         with self.evmCallbackLock:
-            try:
-                self.callbacks.remove(callback)
-            except KeyError:
-                pass
+            for messageType, channels in list(self.callbacks.items()):
+                for channelNumber, callbacks in list(channels.items()):
+                    callbacks.discard(callback)
+                    if not callbacks:
+                        del channels[channelNumber]
+                if not channels:
+                    del self.callbacks[messageType]
+        if isinstance(callback, QueuedCallback):
+            callback.stop()
+    
+    def queueStats(self):
+        with self.evmCallbackLock:
+            queued = set(callback for channels in self.callbacks.values()
+                                  for callbacks in channels.values()
+                                  for callback in callbacks
+                                  if isinstance(callback, QueuedCallback))
+        return dict((callback.callback, callback.stats) for callback in queued)
+    
+    def dispatch(self, messages):
+        with self.evmCallbackLock:
+            index = self.callbacks
+            anyType = index.get(None, {})
+            for message in messages:
+                if isinstance(message, ChannelMessage):
+                    keys = (message.channelNumber, None)
+                else:
+                    keys = (None,)
+                found = [channels[key]
+                         for channels in (index.get(message.type), anyType) if channels
+                         for key in keys if key in channels]
+                # a callback registered under several keys is still called once
+                callbacks = found[0] if len(found) == 1 else set().union(*found)
+                for callback in callbacks:
+                    try:
+                        callback.process(message)
+                    except Exception as err:  # pylint: disable=broad-except
+                        print(err)
     
     def writeMessage(self, msg):
-        self.driver.write(msg)
+        (self.scheduler or self.driver).write(msg)
         return self
     
+    def request(self, msg):
+        # the ack is expected before the command goes out, so it cannot be
+        # missed; with a coalescing driver the command is only queued here
+        request = Request(self.ack, msg)
+        try:
+            request.write = write = (self.scheduler or self.driver).submit(msg)
+        except Exception:
+            request.cancel()
+            raise
+        # a failed write wakes up whoever waits for the ack
+        write.failed = request.waiter.event.set
+        if write.error is not None:
+            write.failed()
+        return request
+    
     def waitForAck(self, msg):
         response = self.ack.waitFor(msg).messageCode
         if response != RESPONSE_NO_ERROR:
@@ -174,7 +483,19 @@ class EventMachine(object):
             if driver is not None:
                 self.driver = driver
             self.driver.open()
+            if self.scheduler is not None:
+                self.scheduler.start(self.driver)
             
+            if self.reactor is not None:
+                try:
+                    self.reactor.register(self)
+                except Exception:
+                    if self.scheduler is not None:
+                        self.scheduler.stop()
+                    self.driver.close()
+                    self.running = False
+                    raise
+                return
             evPump = self.eventPump = Thread(name=name, target=EventPump, args=(self,))
             evPump.start()
     
@@ -183,5 +504,13 @@ class EventMachine(object):
             if not self.running:
                 return
             self.running = False
-        self.eventPump.join()
-        self.driver.close()
+        try:
+            if self.reactor is not None:
+                self.reactor.unregister(self)
+            else:
+                self.eventPump.join()
+        finally:
+            # stopped is stopped: nothing else would ever close the driver
+            if self.scheduler is not None:
+                self.scheduler.stop()
+            self.driver.close()
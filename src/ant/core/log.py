@@ -26,18 +26,127 @@
 
 from __future__ import division, absolute_import, print_function, unicode_literals
 
+from bisect import bisect_left
+from collections import deque
+from glob import glob
+from io import BytesIO
+from threading import Condition, Thread
 from time import time
 import datetime
+import errno
+import os
+import struct
+import zlib
+
+try:
+    import lzma
+except ImportError:  # Python 2
+    lzma = None
+
+try:
+    from time import monotonic_ns
+except ImportError:  # Python < 3.7
+    def monotonic_ns():
+        return int(time() * 1000000000)
 
 import msgpack
+from msgpack.exceptions import OutOfData
 
 EVENT_OPEN = 0x01
 EVENT_CLOSE = 0x02
 EVENT_READ = 0x03
 EVENT_WRITE = 0x04
 
+# Version 2 files are the ['ANT-LOG', 2, start] header (wall clock time of
+# the first timestamp, in ns) followed by blocks. A block is BLOCK_HEADER
+# (magic, codec, stored and raw payload length, record count, monotonic ns of
+# the first record since start) and a payload of msgpack records
+# [event, ns since the previous record(, data)], compressed as per codec.
+# Knowing the stored length, readers can skip a block without unpacking it.
+BLOCK_HEADER = struct.Struct(b'<4sBIIIq')
+BLOCK_MAGIC = b'ANTB'
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+
+CODECS = {None: CODEC_NONE, 'zlib': CODEC_ZLIB, 'lzma': CODEC_LZMA}
+COMPRESS = {CODEC_ZLIB: zlib.compress}
+DECOMPRESS = {CODEC_ZLIB: zlib.decompress}
+if lzma is not None:
+    COMPRESS[CODEC_LZMA] = lzma.compress
+    DECOMPRESS[CODEC_LZMA] = lzma.decompress
+
+# An index is a sidecar file (the log's name plus INDEX_SUFFIX) of
+# INDEX_HEADER followed by INDEX_ENTRY checkpoints: the timestamp of a record,
+# as LogReader returns it, its byte offset in the log and its record number.
+# Version 2 logs are checkpointed at every block, version 1 logs at every
+# INDEX_INTERVAL records.
+INDEX_SUFFIX = '.idx'
+INDEX_HEADER = b'ANT-IDX\x01'
+INDEX_ENTRY = struct.Struct(b'<dQQ')
+INDEX_INTERVAL = 1024
+
+
+def readIndex(filename):
+    # None when there is no index
+    try:
+        with open(filename, 'rb') as fd:
+            data = fd.read()
+    except (IOError, OSError):
+        return None
+    if not data.startswith(INDEX_HEADER):
+        raise IOError('Could not open log index (unknown format).')
+    size = INDEX_ENTRY.size
+    # an entry cut short by a crash is left out
+    return [INDEX_ENTRY.unpack_from(data, offset)
+            for offset in range(len(INDEX_HEADER), len(data) - size + 1, size)]
+
+
+def buildIndex(filename, interval=INDEX_INTERVAL):
+    # For logs written without index=True; interval only applies to
+    # version 1 logs.
+    reader = LogReader(filename)
+    entries = []
+    try:
+        number = 0
+        if reader.version == 2:
+            fd, offset = reader.fd, reader.dataOffset
+            header = fd.read(BLOCK_HEADER.size)
+            while len(header) == BLOCK_HEADER.size:
+                _, _, length, _, count, first = BLOCK_HEADER.unpack(header)
+                entries.append(INDEX_ENTRY.pack((reader.start + first) / 1e9,
+                                                offset, number))
+                number += count
+                fd.seek(length, os.SEEK_CUR)
+                offset = fd.tell()
+                header = fd.read(BLOCK_HEADER.size)
+        else:
+            unpacker = reader.unpacker
+            offset = reader.dataOffset
+            record = reader.read()
+            while record is not None:
+                if not number % interval:
+                    entries.append(INDEX_ENTRY.pack(record[1], offset, number))
+                number += 1
+                offset = unpacker.tell()
+                record = reader.read()
+    finally:
+        reader.close()
+    
+    with open(filename + INDEX_SUFFIX, 'wb') as fd:
+        fd.write(INDEX_HEADER + b''.join(entries))
+    return len(entries)
 
+
+# Records are unpacked straight from the file, READ_SIZE bytes at a time, so
+# memory stays bounded however long the capture is. Version 1 timestamps are
+# whole seconds; version 2 ones are float seconds, ns apart in the file.
+# When the log has an index, seek() and readRange() start reading from the
+# closest checkpoint instead of from the top.
 class LogReader(object):
+    READ_SIZE = 64 * 1024
+    
     def __init__(self, filename):
         self.is_open = False
         self.open(filename)
@@ -46,21 +155,46 @@ class LogReader(object):
         if self.is_open:
             self.fd.close()
     
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        event = self.read()
+        if event is None:
+            raise StopIteration()
+        return event
+    next = __next__
+    
     def open(self, filename):
         if self.is_open == True:
             self.close()
         
-        self.fd = open(filename, 'r')
+        self.fd = open(filename, 'rb')
         self.is_open = True
-        self.unpacker = msgpack.Unpacker()
+        self.version = 1
+        self.pending = None
+        self.unpacker = msgpack.Unpacker(self.fd, read_size=self.READ_SIZE, raw=True)
         
-        # Here be dragons
-        self.unpacker.feed(self.fd.read())
-        self.fd.close()
-        
-        header = self.unpacker.unpack()
-        if len(header) != 2 or header[0] != 'ANT-LOG' or header[1] != 0x01:
+        try:
+            header = self.read()
+        except ValueError:  # not msgpack at all
+            header = None
+        if not isinstance(header, (list, tuple)) or len(header) < 2 or \
+           header[0] not in ('ANT-LOG', b'ANT-LOG') or \
+           (header[1], len(header)) not in ((0x01, 2), (0x02, 3)):
+            self.close()
             raise IOError('Could not open log file (unknown format).')
+        
+        self.dataOffset = self.unpacker.tell()
+        if header[1] == 0x02:
+            self.version = 2
+            self.start = header[2]
+            self.block = iter(())
+            # blocks are read from the file directly from here on
+            self.fd.seek(self.dataOffset)
+        
+        self.index = readIndex(filename + INDEX_SUFFIX)
+        self.indexTimes = [entry[0] for entry in self.index or ()]
     
     def close(self):
         if self.is_open:
@@ -68,55 +202,490 @@ class LogReader(object):
             self.is_open = False
     
     def read(self):
+        if self.pending is not None:
+            record, self.pending = self.pending, None
+            return record
+        if self.version == 2:
+            return self._readRecord()
         try:
             return self.unpacker.unpack()
-        except StopIteration:
+        except (StopIteration, OutOfData):
             return None
+    
+    def _jump(self, offset):
+        self.fd.seek(offset)
+        self.pending = None
+        if self.version == 2:
+            self.block = iter(())
+        else:
+            self.unpacker = msgpack.Unpacker(self.fd, read_size=self.READ_SIZE, raw=True)
+    
+    def seek(self, timestamp):
+        # the next record read is the first one at or after timestamp
+        checkpoint = bisect_left(self.indexTimes, timestamp) - 1
+        if checkpoint < 0:
+            self._jump(self.dataOffset)
+        else:
+            self._jump(self.index[checkpoint][1])
+        
+        record = self.read()
+        while record is not None and record[1] < timestamp:
+            record = self.read()
+        self.pending = record
+    
+    def readRange(self, start, end):
+        # records from start up to, not including, end
+        self.seek(start)
+        for record in self:
+            if record[1] >= end:
+                return
+            yield record
+    
+    def _readBlock(self):
+        # False at the end of the file, or of what was written of it
+        header = self.fd.read(BLOCK_HEADER.size)
+        if len(header) < BLOCK_HEADER.size:
+            return False
+        magic, codec, length, _, count, first = BLOCK_HEADER.unpack(header)
+        if magic != BLOCK_MAGIC or (codec and codec not in DECOMPRESS):
+            raise IOError('Corrupt log file (bad block header).')
+        payload = self.fd.read(length)
+        if len(payload) < length:
+            return False
+        if codec:
+            payload = DECOMPRESS[codec](payload)
+        
+        # the whole block is decoded at once, timestamps made absolute
+        records = list(msgpack.Unpacker(BytesIO(payload), raw=True))
+        if len(records) != count:
+            raise IOError('Corrupt log file (bad block).')
+        stamp, start = first, self.start
+        for record in records:
+            stamp += record[1]
+            record[1] = (start + stamp) / 1e9
+        self.block = iter(records)
+        return True
+    
+    def _readRecord(self):
+        while True:
+            record = next(self.block, None)
+            if record is not None or not self._readBlock():
+                return record
+
+
+# The files of a rotated log read as one. path is the directory they are in,
+# or a glob; files are read in name order, which for the ones LogWriter
+# rotates to is the order they were written in. Each file is only opened
+# once the one before it has been read through.
+class LogSet(object):
+    def __init__(self, path, pattern='*.ant'):
+        if os.path.isdir(path):
+            path = os.path.join(path, pattern)
+        self.filenames = sorted(glob(path))
+        self.position = 0
+        self.reader = None
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        event = self.read()
+        if event is None:
+            raise StopIteration()
+        return event
+    next = __next__
+    
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        self.position = len(self.filenames)
+    
+    def read(self):
+        while True:
+            if self.reader is not None:
+                event = self.reader.read()
+                if event is not None:
+                    return event
+                self.reader.close()
+                self.reader = None
+            if self.position == len(self.filenames):
+                return None
+            self.reader = LogReader(self.filenames[self.position])
+            self.position += 1
+
+
+# One file of a LogWriter, created with its header written.
+class _Segment(object):
+    def __init__(self, writer, filename, exclusive=False):
+        if exclusive:
+            flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+            self.fd = os.fdopen(os.open(filename, flags, 0o666), 'wb')
+        else:
+            self.fd = open(filename, 'wb')
+        self.filename = filename
+        
+        if writer.version == 1:
+            header = ['ANT-LOG', 0x01]  # [MAGIC, VERSION]
+        else:
+            self.start = monotonic_ns()
+            self.wallStart = int(time() * 1000000000)
+            header = ['ANT-LOG', 0x02, self.wallStart]  # [..., START]
+        # not writer.packer, which the writer thread may be using
+        header = msgpack.packb(header, use_bin_type=True)
+        self.fd.write(header)
+        self.offset = len(header)
+        
+        self.index = None
+        if writer.indexed:
+            self.index = open(filename + INDEX_SUFFIX, 'wb')
+            self.index.write(INDEX_HEADER)
+        elif os.path.exists(filename + INDEX_SUFFIX):
+            # left from an earlier log of that name, and wrong for this one
+            os.remove(filename + INDEX_SUFFIX)
+    
+    def close(self, fsync=False):
+        if fsync:
+            self.fd.flush()
+            os.fsync(self.fd.fileno())
+        self.fd.close()
+        if self.index is not None:
+            self.index.close()
+    
+    def remove(self):
+        self.close()
+        os.remove(self.filename)
+        if self.index is not None:
+            os.remove(self.filename + INDEX_SUFFIX)
+
+
+FSYNC_NEVER = 'never'
+FSYNC_FLUSH = 'flush'
+FSYNC_CLOSE = 'close'
 
 
+# With threaded=True records are only queued by the thread logging them; a
+# writer thread packs whatever is queued every flushInterval seconds and
+# writes it in one go. When more than maxsize records are waiting, new ones
+# are dropped and counted. A threaded writer must be closed: whatever is
+# still queued at exit is lost. fsync is one of the FSYNC_* policies.
+#
+# version=2 writes blocks of up to blockSize records, compressed with
+# compression (None, 'zlib' or 'lzma'). Unthreaded, records are held until
+# their block is full, or the log closed or collected. index=True writes the
+# index as the log goes.
+#
+# With maxBytes or maxSeconds set, the log is rotated: filename is a prefix
+# (a directory, or a name a time stamp is appended to), and a new file is
+# started once the current one holds maxBytes or is maxSeconds old.
+# Rotation happens between writes: unthreaded, between records or version 2
+# blocks; threaded, between the batches the writer thread writes.
+# The next file is always created ahead, and the last one closed, by an
+# 'ant-log-next' thread, which leaves the thread rotating with a swap. Files
+# are stamped when created, so around when the one before them came into
+# use, up to maxSeconds (or longer, when nothing is logged) before their
+# first record; the stamps still sort in the order the files were written.
 class LogWriter(object):
-    def __init__(self, filename=''):
-        self.packer = msgpack.Packer()
+    def __init__(self, filename='', threaded=False, maxsize=4096, flushInterval=1.0,
+                 fsync=FSYNC_NEVER, version=1, compression=None, blockSize=1024,
+                 index=False, maxBytes=None, maxSeconds=None):
         self.is_open = False
+        if fsync not in (FSYNC_NEVER, FSYNC_FLUSH, FSYNC_CLOSE):
+            raise ValueError('unknown fsync policy: %r' % (fsync,))
+        if version not in (1, 2):
+            raise ValueError('unknown log version: %r' % (version,))
+        codec = CODECS.get(compression)
+        if codec is None or (codec and codec not in COMPRESS):
+            raise ValueError('unsupported compression: %r' % (compression,))
+        if codec and version == 1:
+            raise ValueError('compression needs version 2')
+        self.version = version
+        self.codec = codec
+        self.blockSize = blockSize
+        self.indexed = index
+        self.index = None
+        self.maxBytes = maxBytes
+        self.maxSeconds = maxSeconds
+        self.rotating = bool(maxBytes or maxSeconds)
+        self.standby = None
+        self.retired = []
+        self.wanted = False
+        self.rotator = None
+        self.rotatorCond = Condition()
+        self.clock = time if version == 1 else monotonic_ns
+        self.threaded = threaded
+        self.maxsize = maxsize
+        self.flushInterval = flushInterval
+        self.fsync = fsync
+        self.dropped = 0
+        self.queue = deque()
+        self.cond = Condition()
+        self.thread = None
+        self.stopping = False
+        self.packer = msgpack.Packer(use_bin_type=True)
         self.open(filename)
     
     def __del__(self):
+        # unthreaded, a writer nobody closed is closed here, so a version 2
+        # block still being filled is kept; a threaded one is only collected
+        # once its thread is gone, and whatever was left queued is lost
         if self.is_open:
-            self.fd.close()
+            if self.thread is None:
+                self.close()
+            else:
+                self.fd.close()
     
     def open(self, filename=''):
-        if filename == '':
-            filename = datetime.datetime.now().isoformat() + '.ant'
-        self.filename = filename
-        
         if self.is_open == True:
             self.close()
         
-        self.fd = open(filename, 'w')
+        self.packer = msgpack.Packer(use_bin_type=True)
+        self.block = []
+        self.stopping = False
+        
+        if self.rotating:
+            if filename == '' or os.path.isdir(filename):
+                self.prefix = os.path.join(filename, '')
+            else:
+                self.prefix = (filename[:-4] if filename.endswith('.ant') else filename) + '-'
+            self._use(self._nextSegment())
+            self.standby, self.retired, self.wanted = None, [], True
+            self.rotations = 0
+            self.rotator = thread = Thread(target=self._runRotator, name='ant-log-next')
+            thread.daemon = True
+            thread.start()
+        else:
+            if filename == '':
+                filename = datetime.datetime.now().isoformat() + '.ant'
+            self._use(_Segment(self, filename))
         self.is_open = True
-        self.packer = msgpack.Packer()
         
-        header = ['ANT-LOG', 0x01]  # [MAGIC, VERSION]
-        self.fd.write(self.packer.pack(header))
+        if self.threaded:
+            self.thread = thread = Thread(target=self._run, name='ant-log')
+            thread.daemon = True
+            thread.start()
     
     def close(self):
-        if self.is_open:
-            self.fd.close()
-            self.is_open = False
+        if not self.is_open:
+            return
+        thread = self.thread
+        # whatever is queued is still written
+        with self.cond:
+            self.stopping = True
+            self.cond.notify()
+        if thread is not None:
+            thread.join()
+            self.thread = None
+        if self.block:
+            self._write(self.block)
+            self.block = []
+        self.segment.close(self.fsync != FSYNC_NEVER)
+        self.index = None
+        
+        if self.rotator is not None:
+            with self.rotatorCond:
+                self.rotatorCond.notify()
+            self.rotator.join()
+            self.rotator = None
+            if self.standby is not None:
+                self.standby.remove()
+                self.standby = None
+        self.is_open = False
+    
+    def _use(self, segment):
+        self.segment = segment
+        self.filename = segment.filename
+        self.fd = segment.fd
+        self.index = segment.index
+        self.offset = segment.offset
+        self.count = 0
+        self.opened = time()
+        if self.version == 2:
+            self.start = segment.start
+            self.wallStart = segment.wallStart
+    
+    def _nextSegment(self):
+        # never truncates an earlier file, even one from the same microsecond
+        while True:
+            stamp = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f')
+            try:
+                return _Segment(self, self.prefix + stamp + '.ant', exclusive=True)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+    
+    def _runRotator(self):
+        cond = self.rotatorCond
+        while True:
+            with cond:
+                while not (self.retired or self.wanted or self.stopping):
+                    cond.wait()
+                retired, self.retired = self.retired, []
+                wanted = self.wanted and self.standby is None and not self.stopping
+                self.wanted = False
+                stopping = self.stopping
+                rotations = self.rotations
+            
+            try:
+                for segment in retired:
+                    segment.close(self.fsync != FSYNC_NEVER)
+                if wanted:
+                    segment = self._nextSegment()
+                    with cond:
+                        # a rotation that found none ready made its own, which
+                        # this one would sort before
+                        stale = self.rotations != rotations
+                        if stale:
+                            self.wanted = True
+                        else:
+                            self.standby = segment
+                    if stale:
+                        segment.remove()
+            except (IOError, OSError) as err:
+                print(err)
+            if stopping:
+                return
+    
+    def _rotateIfFull(self):
+        if (self.maxBytes and self.offset >= self.maxBytes) or \
+           (self.maxSeconds and time() - self.opened >= self.maxSeconds):
+            self._rotate()
+    
+    def _rotate(self):
+        cond = self.rotatorCond
+        with cond:
+            segment, self.standby = self.standby, None
+            self.rotations += 1
+        if segment is None:  # not created ahead (yet), do it here
+            segment = self._nextSegment()
+        with cond:
+            self.retired.append(self.segment)
+            self.wanted = True
+            cond.notify()
+        self._use(segment)
     
     def _logEvent(self, event, data=None):
-        ev = [event, int(time()), data]
-        
         if data is None:
-            ev = ev[0:-1]
+            ev = (event, self.clock())
         elif len(data) == 0:
             return
-       
-        # sending bytearray to packer throws an exception in msgpack
-        if type(ev[-1]) is bytearray:
-            ev[-1] = list(ev[-1])
-
-        self.fd.write(self.packer.pack(ev))
+        elif isinstance(data, bytearray):
+            # packed as msgpack bin, like bytes
+            ev = (event, self.clock(), bytes(data))
+        else:
+            ev = (event, self.clock(), data)
+        
+        if not self.threaded:
+            if self.version == 2:
+                block = self.block
+                block.append(ev)
+                if len(block) >= self.blockSize:
+                    self._write(block)
+                    self.block = []
+            elif self.index is None:
+                if self.rotating:
+                    self._rotateIfFull()
+                data = self._pack(ev)
+                self.fd.write(data)
+                self.offset += len(data)
+                self.count += 1
+            else:
+                self._write((ev,))
+            return
+        
+        with self.cond:
+            queue = self.queue
+            if len(queue) >= self.maxsize:
+                self.dropped += 1
+                return
+            queue.append(ev)
+            # do not wait out the interval with the queue half full
+            if len(queue) == self.maxsize // 2:
+                self.cond.notify()
+    
+    def _pack(self, ev):
+        pack = self.packer.pack
+        if len(ev) == 2:
+            return pack([ev[0], int(ev[1])])
+        return pack([ev[0], int(ev[1]), ev[2]])
+    
+    def _packBlock(self, records):
+        pack = self.packer.pack
+        first = last = records[0][1]
+        chunks = []
+        for ev in records:
+            if len(ev) == 2:
+                chunks.append(pack([ev[0], ev[1] - last]))
+            else:
+                chunks.append(pack([ev[0], ev[1] - last, ev[2]]))
+            last = ev[1]
+        raw = b''.join(chunks)
+        
+        codec, stored = self.codec, raw
+        if codec:
+            stored = COMPRESS[codec](raw)
+            if len(stored) >= len(raw):
+                codec, stored = CODEC_NONE, raw
+        return BLOCK_HEADER.pack(BLOCK_MAGIC, codec, len(stored), len(raw),
+                                 len(records), first - self.start) + stored
+    
+    def _write(self, records):
+        # records are encoded, written and indexed together, in a new file if
+        # the current one is full
+        if self.rotating:
+            self._rotateIfFull()
+        
+        offset, number, entries = self.offset, self.count, []
+        if self.version == 1:
+            chunks = [self._pack(ev) for ev in records]
+            if self.index is not None:
+                for ev, chunk in zip(records, chunks):
+                    if not number % INDEX_INTERVAL:
+                        entries.append(INDEX_ENTRY.pack(int(ev[1]), offset, number))
+                    offset += len(chunk)
+                    number += 1
+        else:
+            records = list(records)
+            size = self.blockSize
+            chunks = []
+            for start in range(0, len(records), size):
+                block = records[start:start + size]
+                chunks.append(self._packBlock(block))
+                if self.index is not None:
+                    first = self.wallStart + block[0][1] - self.start
+                    entries.append(INDEX_ENTRY.pack(first / 1e9, offset, number))
+                    offset += len(chunks[-1])
+                    number += len(block)
+        
+        data = b''.join(chunks)
+        self.fd.write(data)
+        self.offset += len(data)
+        self.count += len(records)
+        if entries:
+            self.index.write(b''.join(entries))
+    
+    def _run(self):
+        cond = self.cond
+        while True:
+            with cond:
+                if not self.stopping:
+                    cond.wait(self.flushInterval)
+                queue, self.queue = self.queue, deque()
+                stopping = self.stopping
+            
+            if queue:
+                try:
+                    self._write(queue)
+                    fd = self.fd  # rotated files are closed as they go
+                    fd.flush()
+                    if self.index is not None:
+                        self.index.flush()
+                    if self.fsync == FSYNC_FLUSH:
+                        os.fsync(fd.fileno())
+                except (IOError, OSError) as err:
+                    print(err)
+            if stopping:
+                return
     
     def logOpen(self):
         self._logEvent(EVENT_OPEN)
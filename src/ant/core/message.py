@@ -26,7 +26,7 @@
 
 from __future__ import division, absolute_import, print_function, unicode_literals
 
-from struct import pack, unpack
+from struct import Struct
 
 from six import with_metaclass
 
@@ -35,16 +35,24 @@ from ant.core.constants import MESSAGE_TX_SYNC, RESPONSE_NO_ERROR
 from ant.core.exceptions import MessageError
 
 
+# Message classes indexed by message ID, used to build decoded messages without
+# going through MessageType.__call__ and the classes' __init__ methods.
+DECODE_TABLE = [None] * 256
+
+
 class MessageType(type):
     
     def __init__(cls, name, bases, dict_):
         super(MessageType, cls).__init__(name, bases, dict_)
-        type_ = cls.type
-        if type_ is not None:
-            cls.TYPES[type_] = cls
+        if cls.typed:
+            cls.TYPES[cls.type] = cls
+            DECODE_TABLE[cls.type] = cls
+    
+    # untyped classes keep their type in a slot behind the 'type' property
+    typed = property(lambda cls: not isinstance(cls.type, property))
     
     def __call__(cls, *args, **kwargs):
-        if cls.type is not None:
+        if cls.typed:
             return super(MessageType, cls).__call__(*args, **kwargs)
         
         type_ = kwargs.get('type')
@@ -67,10 +75,13 @@ class MessageType(type):
 
 MSG_HEADER_SIZE = 3
 MSG_FOOTER_SIZE = 1
+MSG_HEADER = Struct(b'<BBB')
+MSG_SYNC = bytes(bytearray((MESSAGE_TX_SYNC,)))
+UINT16 = Struct(b'<H')
 
 class Message(with_metaclass(MessageType)):
+    __slots__ = ('_payload', '_type')
     TYPES = {}
-    type = None
     
     INCOMPLETE = 'incomplete'
     CORRUPTED = 'corrupted'
@@ -80,6 +91,13 @@ class Message(with_metaclass(MessageType)):
         self._payload = None
         self.payload = payload if payload is not None else bytearray()
     
+    @property
+    def type(self):
+        return self._type
+    @type.setter
+    def type(self, type_):
+        self._type = type_
+    
     @property
     def payload(self):
         return self._payload
@@ -98,37 +116,74 @@ class Message(with_metaclass(MessageType)):
         return checksum
     
     def encode(self):
-        raw, payload = bytearray(len(self)), self._payload
-        raw[0:MSG_HEADER_SIZE-1] = ( MESSAGE_TX_SYNC, len(payload), self.type )
-        raw[MSG_HEADER_SIZE:-MSG_FOOTER_SIZE] = payload
-        raw[-1] = self.checksum
+        raw = bytearray(len(self))
+        self.encodeInto(raw)
         return raw
     
+    def encodeInto(self, buffer_, offset=0):
+        payload = self._payload
+        start = offset + MSG_HEADER_SIZE
+        end = start + len(payload)
+        MSG_HEADER.pack_into(buffer_, offset, MESSAGE_TX_SYNC, len(payload), self.type)
+        buffer_[start:end] = payload
+        buffer_[end] = self.checksum
+        return end + MSG_FOOTER_SIZE - offset
+    
     @classmethod
     def decode(cls, raw):
-        raw = bytearray(raw)
-        if len(raw) < 5:
+        if not isinstance(raw, bytearray):
+            raw = bytearray(raw)
+        return cls._decode(raw, 0)
+    
+    @staticmethod
+    def _decode(buffer_, offset):
+        # a bad sync or length byte is reported as soon as it is there, not
+        # waited on as the start of a frame
+        available = len(buffer_) - offset
+        if available > 0 and buffer_[offset] != MESSAGE_TX_SYNC:
+            raise MessageError('Could not decode (expected TX sync).',
+                               internal=Message.CORRUPTED)
+        if available > 1 and buffer_[offset + 1] > 9:
+            raise MessageError('Could not decode (bad length).',
+                               internal=Message.MALFORMED)
+        if available < 5:
             raise MessageError('Could not decode (message is incomplete).',
                                internal=Message.INCOMPLETE)
         
-        sync, length, type_ = raw[:MSG_HEADER_SIZE]
-        
-        if sync != MESSAGE_TX_SYNC:
-            raise MessageError('Could not decode (expected TX sync).',
-                               internal=Message.CORRUPTED)
-        if len(raw) < (length + MSG_HEADER_SIZE + MSG_FOOTER_SIZE):
+        sync, length, type_ = MSG_HEADER.unpack_from(buffer_, offset)
+        start = offset + MSG_HEADER_SIZE
+        end = start + length
+        if len(buffer_) < end + MSG_FOOTER_SIZE:
             raise MessageError('Could not decode (message is incomplete).',
                                internal=Message.INCOMPLETE)
-            
-        msg = Message(type=type_)  # pylint: disable=unexpected-keyword-arg
-        msg.payload = raw[MSG_HEADER_SIZE:length + MSG_HEADER_SIZE]
         
-        if msg.checksum != raw[length + MSG_HEADER_SIZE]:
+        payload = buffer_[start:end]
+        checksum = sync ^ length ^ type_
+        for byte in payload:
+            checksum ^= byte
+        if checksum != buffer_[end]:
             raise MessageError('Could not decode (bad checksum).',
                                internal=Message.CORRUPTED)
         
+        return Message._build(type_, payload)
+    
+    @staticmethod
+    def _build(type_, payload):
+        # payload and checksum are already validated, skip __init__ and setters
+        class_ = DECODE_TABLE[type_]
+        if class_ is not None:
+            msg = object.__new__(class_)
+        else:
+            msg = object.__new__(Message)
+            msg._type = type_  # pylint: disable=protected-access
+        msg._payload = payload  # pylint: disable=protected-access
         return msg
     
+    def freeze(self):
+        # an immutable payload makes every field setter raise TypeError
+        self._payload = bytes(self._payload)
+        return self
+    
     def __len__(self):
         return len(self._payload) + MSG_HEADER_SIZE + MSG_FOOTER_SIZE
     
@@ -140,6 +195,8 @@ class Message(with_metaclass(MessageType)):
 
 
 class ChannelMessage(Message):
+    __slots__ = ()
+    
     def __init__(self, payload=b'', number=0x00):
         super(ChannelMessage, self).__init__(bytearray(1) + payload)
         self.channelNumber = number
@@ -163,6 +220,7 @@ class ChannelMessage(Message):
 
 # Config messages
 class ChannelUnassignMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_UNASSIGN
     
     def __init__(self, number=0x00):
@@ -170,6 +228,7 @@ class ChannelUnassignMessage(ChannelMessage):
 
 
 class ChannelAssignMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_ASSIGN
     
     def __init__(self, number=0x00, channelType=0x00, network=0x00):
@@ -193,6 +252,7 @@ class ChannelAssignMessage(ChannelMessage):
 
 
 class ChannelIDMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_ID
     
     def __init__(self, number=0x00, device_number=0x0000, device_type=0x00,
@@ -204,10 +264,10 @@ class ChannelIDMessage(ChannelMessage):
     
     @property
     def deviceNumber(self):
-        return unpack(b'<H', bytes(self._payload[1:3]))[0]
+        return UINT16.unpack_from(self._payload, 1)[0]
     @deviceNumber.setter
     def deviceNumber(self, device_number):
-        self._payload[1:3] = pack(b'<H', device_number)
+        UINT16.pack_into(self._payload, 1, device_number)
     
     @property
     def deviceType(self):
@@ -225,6 +285,7 @@ class ChannelIDMessage(ChannelMessage):
 
 
 class ChannelPeriodMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_PERIOD
     
     def __init__(self, number=0x00, period=8192):
@@ -233,13 +294,14 @@ class ChannelPeriodMessage(ChannelMessage):
     
     @property
     def channelPeriod(self):
-        return unpack('<H', bytes(self._payload[1:3]))[0]
+        return UINT16.unpack_from(self._payload, 1)[0]
     @channelPeriod.setter
     def channelPeriod(self, period):
-        self._payload[1:3] = pack('<H', period)
+        UINT16.pack_into(self._payload, 1, period)
 
 
 class ChannelSearchTimeoutMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_SEARCH_TIMEOUT
     
     def __init__(self, number=0x00, timeout=0xFF):
@@ -256,6 +318,7 @@ class ChannelSearchTimeoutMessage(ChannelMessage):
 
 
 class ChannelFrequencyMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_FREQUENCY
     
     def __init__(self, number=0x00, frequency=66):
@@ -271,6 +334,7 @@ class ChannelFrequencyMessage(ChannelMessage):
 
 
 class ChannelTXPowerMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_TX_POWER
     
     def __init__(self, number=0x00, power=0x00):
@@ -286,6 +350,7 @@ class ChannelTXPowerMessage(ChannelMessage):
 
 
 class NetworkKeyMessage(Message):
+    __slots__ = ()
     type = constants.MESSAGE_NETWORK_KEY
     
     def __init__(self, number=0x00, key=b'\x00' * 8):
@@ -309,6 +374,7 @@ class NetworkKeyMessage(Message):
 
 
 class TXPowerMessage(Message):
+    __slots__ = ()
     type = constants.MESSAGE_TX_POWER
     
     def __init__(self, power=0x00):
@@ -325,6 +391,7 @@ class TXPowerMessage(Message):
 
 # Control messages
 class SystemResetMessage(Message):
+    __slots__ = ()
     type = constants.MESSAGE_SYSTEM_RESET
     
     def __init__(self):
@@ -332,6 +399,7 @@ class SystemResetMessage(Message):
 
 
 class ChannelOpenMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_OPEN
     
     def __init__(self, number=0x00):
@@ -339,6 +407,7 @@ class ChannelOpenMessage(ChannelMessage):
 
 
 class ChannelCloseMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_CLOSE
     
     def __init__(self, number=0x00):
@@ -346,6 +415,7 @@ class ChannelCloseMessage(ChannelMessage):
 
 
 class ChannelRequestMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_REQUEST
     
     def __init__(self, number=0x00, messageID=constants.MESSAGE_CHANNEL_STATUS):
@@ -365,6 +435,7 @@ class ChannelRequestMessage(ChannelMessage):
 
 # Data messages
 class ChannelBroadcastDataMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_BROADCAST_DATA
     
     def __init__(self, number=0x00, data=b'\x00' * 7):
@@ -372,6 +443,7 @@ class ChannelBroadcastDataMessage(ChannelMessage):
 
 
 class ChannelAcknowledgedDataMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_ACKNOWLEDGED_DATA
     
     def __init__(self, number=0x00, data=b'\x00' * 7):
@@ -379,6 +451,7 @@ class ChannelAcknowledgedDataMessage(ChannelMessage):
 
 
 class ChannelBurstDataMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_BURST_DATA
     
     def __init__(self, number=0x00, data=b'\x00' * 7):
@@ -387,6 +460,7 @@ class ChannelBurstDataMessage(ChannelMessage):
 
 # Channel event messages
 class ChannelEventResponseMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_EVENT
     
     def __init__(self, number=0x00, message_id=0x00, message_code=0x00):
@@ -427,6 +501,7 @@ class ChannelEventResponseMessage(ChannelMessage):
 
 # Requested response messages
 class ChannelStatusMessage(ChannelMessage):
+    __slots__ = ()
     type = constants.MESSAGE_CHANNEL_STATUS
     
     def __init__(self, number=0x00, status=0x00):
@@ -445,6 +520,7 @@ class ChannelStatusMessage(ChannelMessage):
 
 
 class VersionMessage(Message):
+    __slots__ = ()
     type = constants.MESSAGE_VERSION
     
     def __init__(self, version=b'\x00' * 9):
@@ -463,6 +539,7 @@ class VersionMessage(Message):
 
 
 class StartupMessage(Message):
+    __slots__ = ()
     type = constants.MESSAGE_STARTUP
     
     def __init__(self, startupMessage=0x00):
@@ -480,6 +557,7 @@ class StartupMessage(Message):
 
 
 class CapabilitiesMessage(Message):
+    __slots__ = ()
     type = constants.MESSAGE_CAPABILITIES
     def __init__(self, max_channels=0x00, max_nets=0x00, std_opts=0x00,
                  adv_opts=0x00, adv_opts2=0x00):
@@ -541,6 +619,7 @@ class CapabilitiesMessage(Message):
 
 
 class SerialNumberMessage(Message):
+    __slots__ = ()
     type = constants.MESSAGE_SERIAL_NUMBER
     
     def __init__(self, serial=b'\x00' * 4):
@@ -556,3 +635,161 @@ class SerialNumberMessage(Message):
             raise MessageError('Could not set serial number (expected 4 bytes).')
         
         self.payload = bytearray(serial)
+
+
+# Keeps an encoded message around so that repeated sends only rewrite the
+# payload bytes that changed, patching the checksum as it goes. Its type, and
+# the channel (or network) number it is about where the message has one, are
+# read from the frame, so a template can be sent as a command and its ack
+# still be matched.
+class FrameTemplate(object):
+    
+    def __init__(self, msg):
+        self.frame = msg.encode()
+        self.numbered = isinstance(msg, (ChannelMessage, NetworkKeyMessage))
+        self.channel = isinstance(msg, ChannelMessage)
+    
+    type = property(lambda self: self.frame[2])
+    
+    @property
+    def number(self):
+        return self.frame[MSG_HEADER_SIZE] if self.numbered else None
+    
+    @property
+    def channelNumber(self):
+        if not self.channel:
+            raise AttributeError("'FrameTemplate' of a %.2x message has no "
+                                 "channelNumber" % self.type)
+        return self.frame[MSG_HEADER_SIZE]
+    
+    def update(self, index, data):
+        frame = self.frame
+        start = MSG_HEADER_SIZE + index
+        if index < 0 or start + len(data) > len(frame) - MSG_FOOTER_SIZE:
+            raise MessageError('Could not update payload (out of range).')
+        
+        checksum = frame[-1]
+        for pos, byte in enumerate(bytearray(data), start):
+            old = frame[pos]
+            if old != byte:
+                checksum ^= old ^ byte
+                frame[pos] = byte
+        frame[-1] = checksum
+        return self
+    
+    def encode(self):
+        return self.frame
+    
+    def encodeInto(self, buffer_, offset=0):
+        frame = self.frame
+        buffer_[offset:offset + len(frame)] = frame
+        return len(frame)
+    
+    def __len__(self):
+        return len(self.frame)
+
+
+# Reassembles messages out of a raw byte stream. Data is appended to a single
+# buffer and decoded in place from a read cursor; the consumed prefix is only
+# dropped once per batch, so unconsumed bytes are never copied around.
+class FrameParser(object):
+    
+    def __init__(self, frozen=False):
+        self.frozen = frozen
+        self.discarded = 0
+        self._buffer = bytearray()
+        self._offset = 0
+    
+    def __len__(self):
+        return len(self._buffer) - self._offset
+    
+    def feed(self, data):
+        self._buffer += data
+        return self._frames()
+    
+    def _frames(self):
+        buffer_ = self._buffer
+        while self._offset < len(buffer_):
+            offset = self._offset
+            try:
+                msg = Message._decode(buffer_, offset)  # pylint: disable=protected-access
+            except MessageError as err:
+                if err.internal is Message.INCOMPLETE:
+                    break
+                self._resync(offset + 1)
+                continue
+            
+            self._offset = offset + len(msg)
+            yield msg.freeze() if self.frozen else msg
+        
+        if self._offset:
+            del buffer_[:self._offset]
+            self._offset = 0
+    
+    def _resync(self, start):
+        buffer_ = self._buffer
+        offset = buffer_.find(MSG_SYNC, start)
+        if offset < 0:
+            offset = len(buffer_)
+        self.discarded += offset - self._offset
+        self._offset = offset
+
+
+# Bulk decoding of whole captures. Requires NumPy, which is imported lazily so
+# that the rest of the module does not depend on it.
+FRAME_FIELDS = [('offset', '<i8'), ('length', 'u1'), ('type', 'u1'),
+                ('channel', 'u1'), ('payload', 'u1', (9,)), ('valid', '?')]
+
+
+def scanFrames(buffer_):
+    import numpy as np  # pylint: disable=import-error
+    
+    data = np.frombuffer(buffer_, dtype=np.uint8)
+    size = len(data)
+    
+    # every SYNC byte is a candidate frame; gather its header and check the
+    # XOR over the whole frame (checksum included) through a prefix XOR
+    starts = np.flatnonzero(data == MESSAGE_TX_SYNC)
+    lengths = data.take(starts + 1, mode='clip').astype(np.intp)
+    ends = starts + MSG_HEADER_SIZE + lengths
+    # a length over 9 is bad as soon as it is there, and not waited on
+    bogus = (lengths > 9) & (starts + 2 <= size)
+    complete = bogus | ((starts + 5 <= size) & (ends < size))
+    prefix = np.zeros(size + 1, dtype=np.uint8)
+    np.bitwise_xor.accumulate(data, out=prefix[1:])
+    good = complete & ~bogus & \
+           (prefix.take(ends + 1, mode='clip') == prefix[starts])
+    
+    # walk the candidates in stream order, skipping SYNC bytes that fall
+    # inside an accepted frame
+    offsets, valid = [], []
+    cursor, remainder = 0, 0
+    for start, end, isComplete, isGood in zip(starts.tolist(), ends.tolist(),
+                                               complete.tolist(), good.tolist()):
+        if start < cursor:
+            continue
+        if not isComplete:
+            remainder = size - start
+            break
+        offsets.append(start)
+        valid.append(isGood)
+        cursor = end + 1 if isGood else start + 1
+    
+    offsets = np.array(offsets, dtype=np.intp)
+    frames = np.zeros(len(offsets), dtype=FRAME_FIELDS)
+    frames['offset'] = offsets
+    frames['valid'] = valid
+    frames['length'] = data[offsets + 1]
+    frames['type'] = data[offsets + 2]
+    index = offsets[:, None] + MSG_HEADER_SIZE + np.arange(9)
+    payload = data.take(index, mode='clip')
+    payload[np.arange(9) >= frames['length'][:, None]] = 0
+    frames['payload'] = payload
+    frames['channel'] = payload[:, 0]
+    return frames, remainder
+
+
+def framesToMessages(frames):
+    return [Message._build(int(frame['type']),  # pylint: disable=protected-access
+                           bytearray(frame['payload'][:frame['length']].tobytes()))
+            for frame in frames[frames['valid']]]
@@ -26,6 +26,7 @@
 
 from __future__ import division, absolute_import, print_function, unicode_literals
 
+from time import time
 from uuid import uuid4
 from threading import Lock
 
@@ -33,7 +34,6 @@ from ant.core import event, message
 from ant.core.constants import (EVENT_CHANNEL_CLOSED, CHANNEL_TYPE_TWOWAY_RECEIVE,
                                 MESSAGE_CAPABILITIES)
 from ant.core.exceptions import ChannelError, MessageError, NodeError
-from ant.core.message import ChannelMessage
 
 
 class Network(object):
@@ -134,7 +134,7 @@ class Channel(event.EventCallback):
         except MessageError as err:
             raise ChannelError('%s: could not open: %s' % (self, err))
         
-        evm.registerCallback(self)
+        evm.registerCallback(self, channelNumber=self.number)
     
     def close(self):
         msg = message.ChannelCloseMessage(number=self.number)
@@ -161,30 +161,86 @@ class Channel(event.EventCallback):
         
         self.network = None
     
+    # pylint: disable=redefined-builtin
+    def configure(self, network=None, channelType=None, channelID=None,
+                  searchTimeout=None, period=None, frequency=None, open=False):
+        self.node.configureChannels([(self, dict(
+            network=network, channelType=channelType, channelID=channelID,
+            searchTimeout=searchTimeout, period=period, frequency=frequency,
+            open=open))])
+    
+    def _configSteps(self, network=None, channelType=None, channelID=None,
+                     searchTimeout=None, period=None, frequency=None, open=False):
+        # (message, what, apply) in the order the stick wants them
+        steps = []
+        if network is not None:
+            if channelType is None:
+                channelType = self.type
+            def assigned():
+                self.type = channelType
+                self.network = network
+            steps.append((message.ChannelAssignMessage(self.number, channelType,
+                                                       network.number),
+                          'assign', assigned))
+        if channelID is not None:
+            devType, devNum, transType = channelID
+            def identified():
+                self.device = Device(devNum, devType, transType)
+            steps.append((message.ChannelIDMessage(self.number, devNum, devType,
+                                                   transType),
+                          'set ID', identified))
+        if searchTimeout is not None:
+            def searchTimeoutSet():
+                self._searchTimeout = searchTimeout
+            steps.append((message.ChannelSearchTimeoutMessage(self.number,
+                                                              searchTimeout),
+                          'set search timeout', searchTimeoutSet))
+        if period is not None:
+            def periodSet():
+                self._period = period
+            steps.append((message.ChannelPeriodMessage(self.number, period),
+                          'set period', periodSet))
+        if frequency is not None:
+            def frequencySet():
+                self._frequency = frequency
+            steps.append((message.ChannelFrequencyMessage(self.number, frequency),
+                          'set frequency', frequencySet))
+        if open:
+            def opened():
+                self.node.evm.registerCallback(self, channelNumber=self.number)
+            steps.append((message.ChannelOpenMessage(number=self.number),
+                          'open', opened))
+        return steps
+    # pylint: enable=redefined-builtin
+    
     def registerCallback(self, callback):
         with self.evmCallbackLock:
             self.callbacks.add(callback)
     
+    def removeCallback(self, callback):
+        with self.evmCallbackLock:
+            self.callbacks.discard(callback)
+    
     def process(self, msg):
+        # only called for this channel's messages, see open()
         with self.evmCallbackLock:
-            if isinstance(msg, ChannelMessage) and msg.channelNumber == self.number:
-                for callback in self.callbacks:
-                    try:
-                        callback.process(msg, self)
-                    except Exception as err:  # pylint: disable=broad-except
-                        print(err)
+            for callback in self.callbacks:
+                try:
+                    callback.process(msg, self)
+                except Exception as err:  # pylint: disable=broad-except
+                    print(err)
     
     def __str__(self):
         rawstr = '<channel %d' % self.number
         device = self.device
         if device is not None:
-            rawstr += ' (0x%.2x)' % device
+            rawstr += ' (0x%.2x)' % device.number
         return rawstr + '>'
 
 
 class Node(object):
-    def __init__(self, driver, name=None):
-        self.evm = event.EventMachine(driver)
+    def __init__(self, driver, name=None, reactor=None, scheduler=None):
+        self.evm = event.EventMachine(driver, reactor, scheduler)
         self.name = name
         self.networks = []
         self.channels = []
@@ -213,10 +269,13 @@ class Node(object):
             self.stop()
             raise NodeError(err)
         else:
-            self.networks = [ None ] * caps.maxNetworks
-            self.channels = [ Channel(self, i) for i in range(0, caps.maxChannels) ]
-            self.options = (caps.stdOptions, caps.advOptions, caps.advOptions2)
-
+            self._setCapabilities(caps)
+    
+    def _setCapabilities(self, caps):
+        self.networks = [ None ] * caps.maxNetworks
+        self.channels = [ Channel(self, i) for i in range(0, caps.maxChannels) ]
+        self.options = (caps.stdOptions, caps.advOptions, caps.advOptions2)
+    
     def stop(self):
         if not self.running:
             raise NodeError('Could not stop ANT node (not started).')
@@ -242,11 +301,44 @@ class Node(object):
         
         network.number = number
     
+    def configureChannels(self, configs, timeout=10):
+        # configs: [(channel, dict of Channel.configure arguments), ...]
+        steps = [(channel, msg, what, apply_)
+                 for channel, options in configs
+                 for msg, what, apply_ in channel._configSteps(**options)]  # pylint: disable=protected-access
+        
+        # The whole sequence is written back to back, each command with its
+        # ack already expected; the acks are then collected in command order.
+        evm = self.evm
+        requests = []
+        try:
+            for _, msg, _, _ in steps:
+                requests.append(evm.request(msg))
+        except Exception:
+            for request in requests:
+                request.cancel()
+            raise
+        
+        # Every command the stick acked is applied, failures or not, so the
+        # channels here stay in step with the ones on the stick; the first
+        # failure is raised once all the acks have been collected.
+        error = None
+        deadline = time() + timeout
+        for (channel, _, what, apply_), request in zip(steps, requests):
+            try:
+                request.result(max(deadline - time(), 0))
+            except MessageError as err:
+                error = error or ChannelError('%s: could not %s: %s' % (channel, what, err))
+                continue
+            apply_()
+        if error is not None:
+            raise error
+    
     def getFreeChannel(self):
         for channel in self.channels:
             if channel.network is None:
                 return channel
         raise NodeError('Could not find free channel.')
     
-    def registerEventListener(self, callback):
-        self.evm.registerCallback(callback)
+    def registerEventListener(self, callback, messageType=None, channelNumber=None):
+        self.evm.registerCallback(callback, messageType, channelNumber)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring, invalid-name
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+#
+#
+# Runs the heavy part of a callback in worker processes. Messages are
+# re-encoded into per-worker batches of raw frames and decoded again on the
+# other side, so no Message objects are pickled; each worker gets the
+# messages of its shard in order, and whatever its handler returns is handed
+# back to a results callback in this process.
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import multiprocessing
+from threading import Event, Lock, Thread
+
+from ant.core.event import EventCallback
+from ant.core.message import ChannelMessage, FrameParser
+
+# sync, length, type, up to 9 payload bytes and the checksum
+MAX_FRAME = 13
+
+
+def byChannel(msg):
+    return msg.channelNumber if isinstance(msg, ChannelMessage) else 0
+
+
+def _work(handler, frames, results):
+    parser = FrameParser()
+    process = handler.process
+    while True:
+        data = frames.recv_bytes()
+        if not data:
+            break
+        batch = []
+        for msg in parser.feed(data):
+            try:
+                result = process(msg)
+            except Exception as err:  # pylint: disable=broad-except
+                print(err)
+                continue
+            if result is not None:
+                batch.append(result)
+        if batch:
+            results.send(batch)
+    results.close()
+
+
+class OffloadCallback(EventCallback):
+    # handler is picklable and has process(msg); every worker gets a copy of
+    # its own, so it may keep state about its shard
+    def __init__(self, handler, results, workers=None, shard=byChannel,
+                 batch=64, flushInterval=0.01):
+        self.results = results
+        self.shard = shard
+        self.flushInterval = flushInterval
+        self.lock = Lock()
+        self.stopped = Event()
+        count = workers or multiprocessing.cpu_count()
+        self.buffers = [bytearray(batch * MAX_FRAME) for _ in range(count)]
+        self.offsets = [0] * count
+        
+        self.workers, self.pipes, self.collectors = [], [], []
+        for index in range(count):
+            frames, framesIn = multiprocessing.Pipe(duplex=False)
+            resultsOut, results_ = multiprocessing.Pipe(duplex=False)
+            worker = multiprocessing.Process(target=_work,
+                                             args=(handler, frames, results_))
+            worker.daemon = True
+            worker.start()
+            frames.close()
+            results_.close()
+            collector = Thread(target=self._collect, args=(resultsOut,),
+                               name='offload-%d' % index)
+            collector.daemon = True
+            collector.start()
+            self.workers.append(worker)
+            self.pipes.append(framesIn)
+            self.collectors.append(collector)
+        
+        self.flusher = flusher = Thread(target=self._flushPeriodically)
+        flusher.daemon = True
+        flusher.start()
+    
+    def process(self, msg):
+        index = self.shard(msg) % len(self.buffers)
+        with self.lock:
+            if self.stopped.is_set():
+                return
+            buffer_ = self.buffers[index]
+            offset = self.offsets[index]
+            offset += msg.encodeInto(buffer_, offset)
+            if offset + MAX_FRAME > len(buffer_):
+                self.pipes[index].send_bytes(buffer_, 0, offset)
+                offset = 0
+            self.offsets[index] = offset
+    
+    def flush(self):
+        with self.lock:
+            self._flush()
+    
+    def _flush(self):
+        offsets = self.offsets
+        for index, offset in enumerate(offsets):
+            if offset:
+                self.pipes[index].send_bytes(self.buffers[index], 0, offset)
+                offsets[index] = 0
+    
+    def stop(self):
+        # whatever was handed to us is still processed, by the workers that
+        # are still alive
+        with self.lock:
+            if self.stopped.is_set():
+                return
+            self.stopped.set()
+            for index, pipe in enumerate(self.pipes):
+                try:
+                    if self.offsets[index]:
+                        pipe.send_bytes(self.buffers[index], 0, self.offsets[index])
+                    pipe.send_bytes(b'')
+                except (IOError, OSError) as err:
+                    print(err)
+                self.offsets[index] = 0
+                pipe.close()
+        self.flusher.join()
+        for worker in self.workers:
+            worker.join()
+        for collector in self.collectors:
+            collector.join()
+    
+    def _flushPeriodically(self):
+        while not self.stopped.wait(self.flushInterval):
+            self.flush()
+    
+    def _collect(self, pipe):
+        while True:
+            try:
+                batch = pipe.recv()
+            except EOFError:
+                break
+            for result in batch:
+                try:
+                    self.results(result)
+                except Exception as err:  # pylint: disable=broad-except
+                    print(err)
+        pipe.close()
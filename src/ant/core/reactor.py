@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring, invalid-name
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+#
+#
+# One thread reading and parsing every stick whose driver has a file
+# descriptor (USB1Driver), instead of one event pump thread per stick.
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import os
+from collections import deque
+from threading import Event, Lock, Thread, current_thread
+
+try:
+    import selectors
+except ImportError:
+    import selectors34 as selectors  # pylint: disable=import-error
+
+from ant.core.exceptions import DriverError
+from ant.core.message import FrameParser
+
+
+class Reactor(object):
+    def __init__(self, name=None):
+        self.name = name
+        self.selector = None
+        self.thread = None
+        self.running = False
+        # changes to the selector are made by the reactor thread itself
+        self.pending = deque()
+        self.pendingLock = Lock()
+        self._wakeup = None
+        self._wakeupRead = None
+    
+    def start(self):
+        if self.running:
+            return
+        self.selector = selectors.DefaultSelector()
+        self._wakeupRead, self._wakeup = os.pipe()
+        self.selector.register(self._wakeupRead, selectors.EVENT_READ)
+        self.running = True
+        self.thread = thread = Thread(name=self.name, target=self._run)
+        thread.daemon = True
+        thread.start()
+    
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self._wake()
+        if self.thread is not current_thread():
+            self.thread.join()
+        self.selector.close()
+        os.close(self._wakeupRead)
+        os.close(self._wakeup)
+    
+    def register(self, evm):
+        # here, so a driver without a file descriptor fails in the caller
+        try:
+            fd = evm.driver.fileno()
+        except NotImplementedError:
+            raise DriverError('%s cannot be read from a reactor (no file descriptor)'
+                              % type(evm.driver).__name__)
+        self._change(self._register, (evm, fd))
+    
+    def unregister(self, evm):
+        # once this returns the driver is no longer read, so it can be closed;
+        # a stopped reactor reads nothing, so there is nothing to undo
+        self._change(self._unregister, (evm,), strict=False)
+    
+    def _change(self, change, args, strict=True):
+        # strict: changing a stopped reactor is an error rather than a no-op
+        done = Event()
+        done.error = None
+        with self.pendingLock:
+            if not self.running:
+                if strict:
+                    raise RuntimeError('reactor is not running')
+                return
+            if current_thread() is self.thread:
+                change(*args)
+                return
+            self.pending.append((change, args, done))
+        self._wake()
+        done.wait()
+        if done.error is not None:
+            raise done.error  # pylint: disable=raising-bad-type
+    
+    def _wake(self):
+        os.write(self._wakeup, b'\x00')
+    
+    def _register(self, evm, fd):
+        self.selector.register(fd, selectors.EVENT_READ, (evm, FrameParser()))
+    
+    def _unregister(self, evm):
+        # by what was registered: the driver may not answer fileno() anymore
+        for key in list(self.selector.get_map().values()):
+            if key.data is not None and key.data[0] is evm:
+                self.selector.unregister(key.fd)
+    
+    def _applyPending(self):
+        os.read(self._wakeupRead, 512)
+        with self.pendingLock:
+            pending, self.pending = self.pending, deque()
+        for change, args, done in pending:
+            try:
+                change(*args)
+            except Exception as err:  # pylint: disable=broad-except
+                done.error = err  # raised by whoever asked for the change
+            done.set()
+    
+    def _run(self):
+        selector, wakeupRead = self.selector, self._wakeupRead
+        registered = selector.get_map()
+        while self.running:
+            wake = False
+            for key, _ in selector.select():
+                if key.fd == wakeupRead:
+                    wake = True
+                    continue
+                if key.fd not in registered:  # unregistered by a callback
+                    continue
+                evm, parser = key.data
+                driver = evm.driver
+                try:
+                    data = driver.read(driver.readSize)
+                except Exception as err:  # pylint: disable=broad-except
+                    print(err)
+                    self._unregister(evm)
+                    continue
+                if data:
+                    evm.dispatch(parser.feed(data))
+            # only once this batch is done, as it may touch drivers on their
+            # way out
+            if wake:
+                self._applyPending()
+        
+        # let anyone still waiting on a change go
+        with self.pendingLock:
+            for _, _, done in self.pending:
+                done.set()
+            self.pending.clear()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring, invalid-name
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+#
+#
+# Plays back what a stick sent, as recorded by LogWriter, through the normal
+# driver interface. Reads are paced by the recorded timestamps, at real time,
+# scaled, or as fast as the pump takes them. Writes are dropped, or checked
+# against the writes recorded in the same log.
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+from collections import deque
+from threading import Event, Lock
+from time import sleep, time
+
+from ant.core.driver import Driver
+from ant.core.log import EVENT_READ, EVENT_WRITE, LogReader
+
+
+def _bytes(data):
+    # logs are read raw, so payloads are bytes, or lists where bytearrays used
+    # to be logged as such
+    if isinstance(data, bytes):
+        return data
+    return bytes(bytearray(data))
+
+
+class ReplayDriver(Driver):
+    readSize = 64
+    
+    # speed: 1 for real time, 10 for ten times faster, None as fast as possible
+    def __init__(self, filename, speed=1, verify=False, timeout=0.1, log=None,
+                 debug=False):
+        super(ReplayDriver, self).__init__(log=log, debug=debug)
+        self.filename = filename
+        self.speed = speed
+        self.verify = verify
+        self.timeout = timeout
+        self.finished = Event()
+        self.mismatches = []
+        self._reader = None
+        self._reads = deque()
+        self._writes = deque()
+        self._pending = b''
+        self._start = None
+        self._replayLock = Lock()
+    
+    @property
+    def _opened(self):
+        return self._reader is not None
+    
+    def _open(self):
+        self._reader = LogReader(self.filename)
+        self._reads.clear()
+        self._writes.clear()
+        self._pending = b''
+        self._start = None
+        self.finished.clear()
+        del self.mismatches[:]
+    
+    def _close(self):
+        self._reader.close()
+        self._reader = None
+    
+    def _advance(self):
+        # files the next record of the log; False at its end
+        record = self._reader.read()
+        if record is None:
+            return False
+        if len(record) == 3:
+            event, timestamp, data = record
+            if event == EVENT_READ:
+                self._reads.append((timestamp, _bytes(data)))
+            elif event == EVENT_WRITE and self.verify:
+                self._writes.append(_bytes(data))
+        return True
+    
+    def _due(self, timestamp):
+        # wall clock time at which a record recorded at timestamp plays
+        if self._start is None:
+            self._start = (time(), timestamp)
+        started, first = self._start
+        return started + (timestamp - first) / self.speed
+    
+    def _read(self, count):
+        with self._replayLock:
+            data, wait = self._collect(count)
+        if wait:
+            sleep(wait)
+        return data
+    
+    def _collect(self, count):
+        # (data, 0), or (b'', time to sleep) when nothing is due yet
+        data = self._pending
+        reads = self._reads
+        while len(data) < count:
+            if not reads:
+                if self._advance():
+                    continue
+                if not data:
+                    self.finished.set()
+                    return b'', self.timeout
+                break
+            if self.speed:
+                delay = self._due(reads[0][0]) - time()
+                if delay > 0:
+                    if data:
+                        break
+                    return b'', min(delay, self.timeout)
+            data += reads.popleft()[1]
+        self._pending = data[count:]
+        return data[:count], 0
+    
+    def _write(self, data):
+        if self.verify:
+            data = bytes(data)
+            with self._replayLock:
+                while not self._writes and self._advance():
+                    pass
+                expected = self._writes.popleft() if self._writes else None
+                if expected != data:
+                    self.mismatches.append((expected, data))
+        return len(data)
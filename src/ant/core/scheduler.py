@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring, invalid-name
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+#
+#
+# Decides which queued frame goes to the stick next. Frames are written in
+# order of priority class, first come first served within a class, except
+# broadcast data: only the newest payload of a channel is kept, and it is
+# sent at most once per channel period, as the stick would only transmit
+# one of them per period anyway.
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+from collections import deque
+from threading import Condition, Thread
+from time import time
+
+from ant.core.constants import (MESSAGE_CHANNEL_ACKNOWLEDGED_DATA,
+                                MESSAGE_CHANNEL_BROADCAST_DATA,
+                                MESSAGE_CHANNEL_BURST_DATA, MESSAGE_CHANNEL_PERIOD)
+from ant.core.driver import PendingWrite
+from ant.core.exceptions import DriverError
+from ant.core.message import UINT16
+
+PRIORITY_CONTROL = 0
+PRIORITY_ACKNOWLEDGED = 1
+PRIORITY_BURST = 2
+PRIORITY_BROADCAST = 3
+PRIORITIES = (PRIORITY_CONTROL, PRIORITY_ACKNOWLEDGED, PRIORITY_BURST,
+              PRIORITY_BROADCAST)
+
+CLASSES = {
+    MESSAGE_CHANNEL_ACKNOWLEDGED_DATA: PRIORITY_ACKNOWLEDGED,
+    MESSAGE_CHANNEL_BURST_DATA: PRIORITY_BURST,
+    MESSAGE_CHANNEL_BROADCAST_DATA: PRIORITY_BROADCAST,
+}
+
+# channel period in 1/32768 s, until the channel is told otherwise
+DEFAULT_PERIOD = 8192
+
+
+def priorityOf(frame):
+    return CLASSES.get(frame[2], PRIORITY_CONTROL)
+
+
+class _Class(object):
+    __slots__ = ('sent', 'replaced', 'latency', 'maxLatency')
+    
+    def __init__(self):
+        self.sent = self.replaced = 0
+        self.latency = self.maxLatency = 0.0
+
+
+class TxScheduler(object):
+    # timeout: how long write() waits for its frame to go out
+    def __init__(self, name=None, timeout=10):
+        self.name = name
+        self.timeout = timeout
+        self.driver = None
+        self.thread = None
+        self.running = False
+        self.cond = Condition()
+        self.queues = dict((priority, deque()) for priority in PRIORITIES
+                           if priority != PRIORITY_BROADCAST)
+        # {channelNumber: (queued, frame, pending)}, newest payload only
+        self.broadcasts = {}
+        self.periods = {}
+        self.lastBroadcast = {}
+        self.classes = dict((priority, _Class()) for priority in PRIORITIES)
+    
+    def start(self, driver):
+        with self.cond:
+            if self.running:
+                return
+            self.driver = driver
+            self.running = True
+        self.thread = thread = Thread(target=self._run, name=self.name)
+        thread.daemon = True
+        thread.start()
+    
+    def stop(self):
+        # whatever is queued is still written, paced broadcasts included
+        with self.cond:
+            if not self.running:
+                return
+            self.running = False
+            self.cond.notify()
+        self.thread.join()
+    
+    def submit(self, msg):
+        frame = bytearray(msg if isinstance(msg, (bytes, bytearray)) else msg.encode())
+        pending = PendingWrite(frame)
+        priority = priorityOf(frame)
+        with self.cond:
+            if not self.running:
+                raise DriverError("Could not write to device (scheduler not running).")
+            if priority == PRIORITY_BROADCAST:
+                replaced = self.broadcasts.get(frame[3])
+                if replaced is not None:
+                    self.classes[priority].replaced += 1
+                    replaced[2].complete(0)
+                self.broadcasts[frame[3]] = (time(), frame, pending)
+            else:
+                self.queues[priority].append((time(), frame, pending))
+            self.cond.notify()
+        return pending
+    
+    def write(self, msg):
+        return self.submit(msg).wait(self.timeout)
+    
+    @property
+    def stats(self):
+        with self.cond:
+            stats = {}
+            for priority, class_ in self.classes.items():
+                if priority == PRIORITY_BROADCAST:
+                    depth = len(self.broadcasts)
+                else:
+                    depth = len(self.queues[priority])
+                sent = class_.sent
+                stats[priority] = {
+                    'depth': depth, 'sent': sent, 'replaced': class_.replaced,
+                    'maxLatency': class_.maxLatency,
+                    'latency': class_.latency / sent if sent else 0.0}
+            return stats
+    
+    def _due(self, channelNumber):
+        period = self.periods.get(channelNumber, DEFAULT_PERIOD)
+        return self.lastBroadcast.get(channelNumber, 0.0) + period / 32768
+    
+    def _next(self):
+        # (priority, entry) to write now, or (None, when) to wait until
+        queues = self.queues
+        for priority in (PRIORITY_CONTROL, PRIORITY_ACKNOWLEDGED, PRIORITY_BURST):
+            if queues[priority]:
+                return priority, queues[priority].popleft()
+        
+        broadcasts = self.broadcasts
+        if not broadcasts:
+            return None, None
+        now = time()
+        channelNumber, when = min(((number, self._due(number)) for number in broadcasts),
+                                  key=lambda item: item[1])
+        if when > now and self.running:
+            return None, when
+        return PRIORITY_BROADCAST, broadcasts.pop(channelNumber)
+    
+    def _run(self):
+        cond = self.cond
+        while True:
+            with cond:
+                while True:
+                    priority, entry = self._next()
+                    if priority is not None:
+                        break
+                    if entry is None and not self.running:
+                        return
+                    cond.wait(None if entry is None else entry - time())
+            
+            queued, frame, pending = entry
+            try:
+                count = self.driver.write(frame)
+            except Exception as err:  # pylint: disable=broad-except
+                if not isinstance(err, DriverError):
+                    err = DriverError(str(err))
+                pending.complete(error=err)
+                continue
+            
+            now = time()
+            with cond:
+                if priority == PRIORITY_BROADCAST:
+                    self.lastBroadcast[frame[3]] = now
+                elif frame[2] == MESSAGE_CHANNEL_PERIOD:
+                    self.periods[frame[3]] = UINT16.unpack_from(frame, 4)[0]
+                class_ = self.classes[priority]
+                class_.sent += 1
+                class_.latency += now - queued
+                class_.maxLatency = max(class_.maxLatency, now - queued)
+            pending.complete(count)
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring, invalid-name
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+#
+#
+# An ANT stick in software. SimulatedDriver answers the commands the node
+# sends the way a stick would, and feeds every open receive channel the
+# broadcasts of a matching VirtualDevice at the channel period. It runs
+# either in real time or on a virtual clock that jumps straight to the next
+# broadcast, so a run always produces the same traffic as fast as it can be
+# read.
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+from struct import Struct
+from threading import Condition, Thread
+from time import time
+
+from ant.core import message
+from ant.core.constants import (EVENT_CHANNEL_CLOSED, EVENT_TX, CHANNEL_IN_WRONG_STATE,
+                                INVALID_MESSAGE, INVALID_NETWORK_NUMBER,
+                                MESSAGE_CAPABILITIES, MESSAGE_CHANNEL_ID,
+                                MESSAGE_CHANNEL_STATUS, RESPONSE_NO_ERROR)
+from ant.core.driver import Driver
+from ant.core.message import FrameParser
+
+STATE_UNASSIGNED = 0
+STATE_ASSIGNED = 1
+STATE_SEARCHING = 2
+STATE_TRACKING = 3
+
+HRM_PAGE = Struct(b'<BBBBHBB')
+
+
+class VirtualDevice(object):
+    def __init__(self, deviceType, deviceNumber, transmissionType=1):
+        self.deviceType = deviceType
+        self.deviceNumber = deviceNumber
+        self.transmissionType = transmissionType
+    
+    def matches(self, devType, devNum, transType):
+        # zero is a wildcard in a channel ID
+        return devType in (0, self.deviceType) and \
+               devNum in (0, self.deviceNumber) and \
+               transType in (0, self.transmissionType)
+    
+    def payload(self, count, elapsed):  # pylint: disable=unused-argument
+        # 8 bytes of broadcast data; the message count by default
+        return Struct(b'<Q').pack(count)
+
+
+class HeartRateDevice(VirtualDevice):
+    def __init__(self, deviceNumber, bpm=60, transmissionType=1):
+        super(HeartRateDevice, self).__init__(120, deviceNumber, transmissionType)
+        self.bpm = bpm
+    
+    def payload(self, count, elapsed):
+        beats = int(elapsed * self.bpm / 60)
+        beatTime = int(beats * 60 / self.bpm * 1024) & 0xFFFF
+        return HRM_PAGE.pack(0x00, 0xFF, 0xFF, 0xFF, beatTime, beats & 0xFF, self.bpm)
+
+
+class _Channel(object):
+    def __init__(self):
+        self.state = STATE_UNASSIGNED
+        self.channelType = 0
+        self.network = 0
+        self.id = (0, 0, 0)
+        self.period = 8192
+        self.device = None
+        self.count = 0
+        self.opened = 0.0
+        self.due = 0.0
+    
+    @property
+    def status(self):
+        return self.state | (self.network << 2) | (self.channelType & 0xF0)
+
+
+class SimulatedDriver(Driver):
+    readSize = 64
+    
+    def __init__(self, devices=(), realtime=True, maxChannels=8, maxNetworks=3,
+                 log=None, debug=False):
+        super(SimulatedDriver, self).__init__(log=log, debug=debug)
+        self.devices = list(devices)
+        self.realtime = realtime
+        self.maxChannels = maxChannels
+        self.maxNetworks = maxNetworks
+        self.broadcasts = 0
+        self.clock = 0.0
+        self._cond = Condition()
+        self._buffer = bytearray()
+        self._parser = FrameParser()
+        self._channels = []
+        self._isOpen = False
+        self._ticker = None
+        self._reset()
+    
+    @property
+    def _opened(self):
+        return self._isOpen
+    
+    def _open(self):
+        self._isOpen = True
+        if self.realtime:
+            self._ticker = ticker = Thread(target=self._tick, name='ant-simulator')
+            ticker.daemon = True
+            ticker.start()
+    
+    def _close(self):
+        with self._cond:
+            self._isOpen = False
+            self._cond.notify_all()
+        if self._ticker is not None:
+            self._ticker.join()
+            self._ticker = None
+    
+    def _now(self):
+        return time() if self.realtime else self.clock
+    
+    def _reset(self):
+        self._channels = [_Channel() for _ in range(self.maxChannels)]
+    
+    def _read(self, count):
+        cond, buffer_ = self._cond, self._buffer
+        with cond:
+            if not buffer_:
+                if self.realtime or not self._broadcast(count):
+                    cond.wait(0.01)
+            data = bytes(buffer_[:count])
+            del buffer_[:count]
+        return data
+    
+    def _write(self, data):
+        with self._cond:
+            for msg in self._parser.feed(data):
+                self._command(msg)
+            self._cond.notify_all()
+        return len(data)
+    
+    def _reply(self, msg):
+        self._buffer += msg.encode()
+    
+    def _respond(self, number, messageID, code=RESPONSE_NO_ERROR):
+        self._reply(message.ChannelEventResponseMessage(number, messageID, code))
+    
+    def _command(self, msg):
+        # pylint: disable=too-many-branches
+        if isinstance(msg, message.SystemResetMessage):
+            self._reset()
+            self._reply(message.StartupMessage())
+            return
+        if isinstance(msg, message.NetworkKeyMessage):
+            code = RESPONSE_NO_ERROR if msg.number < self.maxNetworks \
+                   else INVALID_NETWORK_NUMBER
+            self._respond(msg.number, msg.type, code)
+            return
+        if not isinstance(msg, message.ChannelMessage) or \
+           msg.channelNumber >= self.maxChannels:
+            self._respond(getattr(msg, 'channelNumber', 0), msg.type, INVALID_MESSAGE)
+            return
+        
+        number = msg.channelNumber
+        channel = self._channels[number]
+        code = RESPONSE_NO_ERROR
+        if isinstance(msg, message.ChannelRequestMessage):
+            messageID = msg.messageID
+            if messageID == MESSAGE_CAPABILITIES:
+                self._reply(message.CapabilitiesMessage(self.maxChannels,
+                                                        self.maxNetworks))
+            elif messageID == MESSAGE_CHANNEL_STATUS:
+                self._reply(message.ChannelStatusMessage(number, channel.status))
+            elif messageID == MESSAGE_CHANNEL_ID:
+                devType, devNum, transType = channel.id
+                self._reply(message.ChannelIDMessage(number, devNum, devType, transType))
+            else:
+                self._respond(number, msg.type, INVALID_MESSAGE)
+            return
+        elif isinstance(msg, message.ChannelAssignMessage):
+            if channel.state != STATE_UNASSIGNED:
+                code = CHANNEL_IN_WRONG_STATE
+            else:
+                channel.state = STATE_ASSIGNED
+                channel.channelType = msg.channelType
+                channel.network = msg.networkNumber
+        elif isinstance(msg, message.ChannelUnassignMessage):
+            if channel.state != STATE_ASSIGNED:
+                code = CHANNEL_IN_WRONG_STATE
+            else:
+                self._channels[number] = _Channel()
+        elif isinstance(msg, message.ChannelIDMessage):
+            channel.id = (msg.deviceType, msg.deviceNumber, msg.transmissionType)
+        elif isinstance(msg, message.ChannelPeriodMessage):
+            channel.period = msg.channelPeriod
+        elif isinstance(msg, message.ChannelOpenMessage):
+            if channel.state != STATE_ASSIGNED:
+                code = CHANNEL_IN_WRONG_STATE
+            else:
+                self._openChannel(channel)
+        elif isinstance(msg, message.ChannelCloseMessage):
+            if channel.state < STATE_SEARCHING:
+                code = CHANNEL_IN_WRONG_STATE
+            else:
+                channel.state = STATE_ASSIGNED
+                self._respond(number, msg.type)
+                self._respond(number, 1, EVENT_CHANNEL_CLOSED)
+                return
+        elif isinstance(msg, (message.ChannelBroadcastDataMessage,
+                              message.ChannelAcknowledgedDataMessage,
+                              message.ChannelBurstDataMessage)):
+            return  # goes out with the next EVENT_TX
+        self._respond(number, msg.type, code)
+    
+    def _openChannel(self, channel):
+        channel.state = STATE_SEARCHING
+        channel.device = None
+        # the first message comes a period after the channel opens
+        channel.opened = self._now()
+        channel.due = channel.opened + channel.period / 32768
+        channel.count = 0
+        if channel.channelType & 0x10:  # master: transmits EVENT_TX every period
+            channel.state = STATE_TRACKING
+            return
+        for device in self.devices:
+            if device.matches(*channel.id):
+                channel.device = device
+                channel.state = STATE_TRACKING
+                break
+    
+    def _nextDue(self):
+        # the open channel whose next message is due first
+        pending = [(channel.due, number) for number, channel in enumerate(self._channels)
+                   if channel.state == STATE_TRACKING]
+        return min(pending) if pending else (None, None)
+    
+    def _emit(self, number):
+        channel = self._channels[number]
+        if channel.device is None:
+            self._respond(number, 1, EVENT_TX)
+        else:
+            data = channel.device.payload(channel.count, channel.due - channel.opened)
+            self._reply(message.ChannelBroadcastDataMessage(number, data=data))
+            self.broadcasts += 1
+        channel.count += 1
+        channel.due += channel.period / 32768
+    
+    def _broadcast(self, count):
+        # virtual clock: jump to whatever is due next, until count bytes are ready
+        buffer_ = self._buffer
+        while len(buffer_) < count:
+            due, number = self._nextDue()
+            if due is None:
+                break
+            self.clock = max(self.clock, due)
+            self._emit(number)
+        return bool(buffer_)
+    
+    def _tick(self):
+        cond = self._cond
+        with cond:
+            while self._isOpen:
+                due, number = self._nextDue()
+                now = time()
+                if due is None or due > now:
+                    cond.wait(0.1 if due is None else min(due - now, 0.1))
+                    continue
+                self._emit(number)
+                cond.notify_all()
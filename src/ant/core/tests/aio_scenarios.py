@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring, invalid-name
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+# Coroutines for aio_tests, kept apart so that module still parses where
+# async def does not.
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import asyncio
+
+from ant.core import message
+from ant.core.constants import CHANNEL_TYPE_TWOWAY_RECEIVE
+from ant.core.event import EventCallback, OVERFLOW_DROP_OLDEST
+from ant.core.exceptions import ChannelError
+from ant.core.node import Network
+
+
+class Counter(EventCallback):
+    def __init__(self):
+        self.count = 0
+    
+    def process(self, msg, _channel):
+        self.count += 1
+
+
+async def openChannel(node):
+    network = Network(key=b'\x00' * 8)
+    await node.setNetworkKey(0, network)
+    channel = node.getFreeChannel()
+    await channel.assign(network, CHANNEL_TYPE_TWOWAY_RECEIVE)
+    await channel.setID(120, 0, 0)
+    await channel.setPeriod(8070)
+    await channel.setFrequency(57)
+    return channel
+
+
+async def channelScenario(test, node):
+    await node.start()
+    try:
+        test.assertEqual(node.node.getCapabilities()[:2], (8, 3))
+        channel = await openChannel(node)
+        test.assertEqual(channel.channel.period, 8070)
+        
+        await channel.open()
+        with test.assertRaises(ChannelError):
+            await channel.unassign()  # not while it is open
+        stream = channel.messages(maxsize=2)
+        received = [await stream.__anext__() for _ in range(3)]
+        test.assertTrue(all(isinstance(msg, message.ChannelBroadcastDataMessage)
+                            for msg in received))
+        await stream.aclose()
+        
+        await channel.close()
+        await channel.unassign()
+        test.assertTrue(channel.channel.network is None)
+    finally:
+        node.stop()
+
+
+async def stalledStreamScenario(test, node):
+    await node.start()
+    try:
+        channel = await openChannel(node)
+        counter = Counter()
+        channel.registerCallback(counter)
+        stream = channel.messages(maxsize=1)
+        await channel.open()
+        await stream.__anext__()
+        # nobody reads the stream any more; the other listener keeps going
+        await asyncio.sleep(0.2)
+        test.assertTrue(counter.count > 3)
+        test.assertTrue(stream.dropped > 0)
+        await stream.aclose()
+        await channel.close()
+    finally:
+        node.stop()
+
+
+async def dropOldestScenario(test, node):
+    await node.start()
+    try:
+        channel = await openChannel(node)
+        async with channel.messages(maxsize=1, overflow=OVERFLOW_DROP_OLDEST) as stream:
+            await channel.open()
+            first = await stream.__anext__()
+            await asyncio.sleep(0.2)
+            test.assertTrue(stream.dropped > 0)
+            # the one kept is the latest
+            latest = await stream.__anext__()
+            test.assertTrue(latest is not first)
+        test.assertTrue(stream.closed)
+        with test.assertRaises(StopAsyncIteration):
+            await stream.__anext__()
+        await channel.close()
+    finally:
+        node.stop()
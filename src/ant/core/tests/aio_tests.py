@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring, invalid-name
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import unittest
+
+try:
+    import asyncio
+    from ant.core.aio import AsyncNode
+    from aio_scenarios import channelScenario, dropOldestScenario, stalledStreamScenario
+except (ImportError, SyntaxError):
+    asyncio = None
+
+from ant.core.simulator import SimulatedDriver, VirtualDevice
+
+
+@unittest.skipIf(asyncio is None, 'requires asyncio')
+class AsyncNodeTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = SimulatedDriver([VirtualDevice(120, 1)], realtime=False)
+        self.node = AsyncNode(self.driver, timeout=1)
+
+    def run_async(self, coro):
+        return asyncio.run(asyncio.wait_for(coro, 5))
+
+    def test_channel(self):
+        self.run_async(channelScenario(self, self.node))
+
+    def test_stalled_stream(self):
+        self.run_async(stalledStreamScenario(self, self.node))
+
+    def test_drop_oldest(self):
+        self.run_async(dropOldestScenario(self, self.node))
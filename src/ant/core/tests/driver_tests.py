@@ -26,9 +26,11 @@
 
 from __future__ import division, absolute_import, print_function, unicode_literals
 
+import os
+import time
 import unittest
 
-from ant.core.driver import Driver
+from ant.core.driver import Driver, USB1Driver
 from ant.core.exceptions import DriverError
 
 
@@ -85,16 +87,28 @@ class DriverTest(unittest.TestCase):
         self.driver.close()
 
 
-# How do you even test this without hardware?
+# A pseudo terminal stands in for the stick's serial port.
+@unittest.skipUnless(hasattr(os, 'openpty'), 'requires a pseudo terminal')
 class USB1DriverTest(unittest.TestCase):
-    def _open(self):
-        pass
-
-    def _close(self):
-        pass
+    def setUp(self):
+        self.master, slave = os.openpty()
+        self.slave = slave
+        self.driver = USB1Driver(os.ttyname(slave), timeout=0.05)
+        self.driver.open()
 
-    def _read(self):
-        pass
+    def tearDown(self):
+        self.driver.close()
+        os.close(self.master)
+        os.close(self.slave)
 
-    def _write(self):
-        pass
+    def test_read(self):
+        os.write(self.master, b'\xA4' * 100)
+        time.sleep(0.05)
+        # whatever is buffered comes back in one read, up to the cap
+        self.assertEqual(self.driver.read(64), b'\xA4' * 64)
+        self.assertEqual(self.driver.read(self.driver.readSize), b'\xA4' * 36)
+
+    def test_timeout(self):
+        start = time.time()
+        self.assertEqual(self.driver.read(self.driver.readSize), b'')
+        self.assertTrue(time.time() - start >= 0.04)
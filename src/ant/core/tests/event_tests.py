@@ -25,8 +25,345 @@
 
 from __future__ import division, absolute_import, print_function, unicode_literals
 
-#import unittest
+import unittest
+from threading import Event, Timer
+
+from ant.core.constants import MESSAGE_CHANNEL_BROADCAST_DATA
+from ant.core.driver import Driver
+from ant.core.event import (AckCallback, EventCallback, EventMachine, MsgCallback,
+                            QueuedCallback, Request, OVERFLOW_DROP_NEWEST,
+                            OVERFLOW_DROP_OLDEST)
+from ant.core.exceptions import DriverError, MessageError
+from ant.core import message
+from ant.core.message import FrameParser
 
-#from ant.core.event import *
 
 # How exactly do you properly test threaded code?
+class MsgCallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.callback = MsgCallback([message.StartupMessage])
+
+    def test_queued(self):
+        msg = message.StartupMessage()
+        self.callback.process(message.ChannelBroadcastDataMessage())
+        self.callback.process(msg)
+        self.assertTrue(self.callback.waitFor(message.StartupMessage, timeout=0) is msg)
+        # nobody subscribed to broadcasts, so they are not kept
+        self.assertEqual(list(self.callback.mailboxes), [message.StartupMessage.type])
+        self.assertEqual(len(self.callback.mailboxes[message.StartupMessage.type]), 0)
+
+    def test_ring(self):
+        callback = self.callback
+        for _ in range(callback.MAX_QUEUE + 5):
+            callback.process(message.StartupMessage())
+        self.assertEqual(len(callback.mailboxes[message.StartupMessage.type]),
+                         callback.MAX_QUEUE)
+
+    def test_unsubscribed(self):
+        self.callback.process(message.CapabilitiesMessage())
+        self.assertRaises(MessageError, self.callback.waitFor,
+                          message.CapabilitiesMessage, timeout=0)
+        self.callback.subscribe(message.CapabilitiesMessage)
+        msg = message.CapabilitiesMessage()
+        self.callback.process(msg)
+        self.assertTrue(self.callback.waitFor(message.CapabilitiesMessage, timeout=0) is msg)
+        self.callback.unsubscribe(message.CapabilitiesMessage)
+        self.assertFalse(message.CapabilitiesMessage.type in self.callback.mailboxes)
+
+    def test_waiter(self):
+        msg = message.CapabilitiesMessage()
+        Timer(0.01, self.callback.process, (msg,)).start()
+        self.assertTrue(self.callback.waitFor(message.CapabilitiesMessage, timeout=1) is msg)
+        self.assertEqual(self.callback.waiters, {})
+
+    def test_timeout(self):
+        self.assertRaises(MessageError, self.callback.waitFor,
+                          message.StartupMessage, timeout=0.01)
+        self.assertEqual(self.callback.waiters, {})
+
+    def test_baseClass(self):
+        # a base class matches the messages derived from it, as a class does its own
+        callback = self.callback
+        msg = message.StartupMessage()
+        callback.process(msg)
+        self.assertTrue(callback.waitFor(message.Message, timeout=0) is msg)
+
+        msg = message.ChannelBroadcastDataMessage()
+        Timer(0.01, callback.process, (msg,)).start()
+        self.assertTrue(callback.waitFor(message.ChannelMessage, timeout=1) is msg)
+
+        callback.subscribe(message.ChannelMessage)
+        msg = message.ChannelStatusMessage()
+        callback.process(msg)
+        self.assertTrue(callback.waitFor(message.ChannelMessage, timeout=0) is msg)
+        self.assertEqual(callback.waiters, {})
+
+
+def ackFor(msg, code=0):
+    number = msg.number if isinstance(msg, message.NetworkKeyMessage) \
+             else msg.channelNumber
+    return message.ChannelEventResponseMessage(number, msg.type, code)
+
+
+class AckCallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.callback = AckCallback()
+
+    def test_channel(self):
+        period0 = message.ChannelPeriodMessage(0)
+        period1 = message.ChannelPeriodMessage(1)
+        ack1 = ackFor(period1)
+        self.callback.process(ack1)
+        self.assertRaises(MessageError, self.callback.waitFor, period0, timeout=0)
+        self.assertTrue(self.callback.waitFor(period1, timeout=0) is ack1)
+
+    def test_network(self):
+        key0 = message.NetworkKeyMessage(0)
+        key1 = message.NetworkKeyMessage(1)
+        ack0 = ackFor(key0)
+        self.callback.process(ack0)
+        self.assertRaises(MessageError, self.callback.waitFor, key1, timeout=0)
+        self.assertTrue(self.callback.waitFor(key0, timeout=0) is ack0)
+
+    def test_other(self):
+        power = message.TXPowerMessage()
+        ack = message.ChannelEventResponseMessage(0, power.type, 0)
+        self.callback.process(ack)
+        self.assertTrue(self.callback.waitFor(power, timeout=0) is ack)
+
+
+class RecordingDriver(Driver):
+    def __init__(self, coalesce=False):
+        super(RecordingDriver, self).__init__(coalesce=coalesce)
+        self.isOpen = False
+        self.messages = []
+        self.transfers = []
+
+    _opened = property(lambda self: self.isOpen)
+
+    def _open(self):
+        self.isOpen = True
+
+    def _close(self):
+        self.isOpen = False
+
+    def _write(self, data):
+        self.transfers.append(data)
+        self.messages.extend(FrameParser().feed(data))
+        return len(data)
+
+
+class RecordingCallback(EventCallback):
+    def __init__(self):
+        self.messages = []
+
+    def process(self, msg):
+        self.messages.append(msg)
+
+
+class BlockingCallback(RecordingCallback):
+    def __init__(self):
+        super(BlockingCallback, self).__init__()
+        self.release = Event()
+
+    def process(self, msg):
+        self.release.wait(1)
+        super(BlockingCallback, self).process(msg)
+
+
+class QueuedCallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.target = BlockingCallback()
+
+    def tearDown(self):
+        self.target.release.set()
+        self.callback.stop()
+
+    def fill(self, overflow):
+        self.callback = callback = QueuedCallback(self.target, maxsize=2, overflow=overflow)
+        messages = [message.ChannelStatusMessage(status=i) for i in range(5)]
+        for msg in messages:
+            callback.process(msg)
+        return messages
+
+    def test_dropOldest(self):
+        messages = self.fill(OVERFLOW_DROP_OLDEST)
+        stats = self.callback.stats
+        self.assertEqual(stats['depth'], 2)
+        # the first message may or may not have made it to the worker yet
+        self.assertTrue(stats['dropped'] in (2, 3))
+        self.target.release.set()
+        self.callback.stop()
+        self.assertEqual(self.target.messages[-1:], messages[-1:])
+
+    def test_dropNewest(self):
+        messages = self.fill(OVERFLOW_DROP_NEWEST)
+        self.target.release.set()
+        self.callback.stop()
+        self.assertEqual(self.target.messages[0], messages[0])
+        self.assertTrue(self.callback.stats['dropped'] in (2, 3))
+
+    def test_queueStats(self):
+        evm = EventMachine(None)
+        self.callback = callback = QueuedCallback(self.target)
+        evm.registerCallback(callback)
+        self.target.release.set()
+        evm.dispatch([message.StartupMessage()])
+        stats = evm.queueStats()
+        self.assertEqual(list(stats.keys()), [self.target])
+        evm.removeCallback(callback)
+        self.assertEqual(evm.queueStats(), {})
+        self.assertFalse(callback.thread.is_alive())
+
+
+class EventMachineTest(unittest.TestCase):
+    def setUp(self):
+        self.evm = EventMachine(None)
+
+    def test_dispatch(self):
+        evm = self.evm
+        anything, channel1, broadcast1 = [RecordingCallback() for _ in range(3)]
+        evm.registerCallback(anything)
+        evm.registerCallback(channel1, channelNumber=1)
+        evm.registerCallback(broadcast1, MESSAGE_CHANNEL_BROADCAST_DATA, 1)
+        
+        messages = [message.ChannelBroadcastDataMessage(number=1),
+                    message.ChannelBroadcastDataMessage(number=2),
+                    message.ChannelStatusMessage(number=1),
+                    message.StartupMessage()]
+        evm.dispatch(messages)
+        self.assertEqual(anything.messages, messages)
+        self.assertEqual(channel1.messages, [messages[0], messages[2]])
+        self.assertEqual(broadcast1.messages, [messages[0]])
+
+    def test_dispatchOnce(self):
+        # registered under several matching keys, still called once
+        evm = self.evm
+        callback = RecordingCallback()
+        evm.registerCallback(callback)
+        evm.registerCallback(callback, channelNumber=1)
+        evm.registerCallback(callback, MESSAGE_CHANNEL_BROADCAST_DATA, 1)
+
+        messages = [message.ChannelBroadcastDataMessage(number=1),
+                    message.StartupMessage()]
+        evm.dispatch(messages)
+        self.assertEqual(callback.messages, messages)
+
+    def test_removeCallback(self):
+        evm = self.evm
+        callback = RecordingCallback()
+        evm.registerCallback(callback, channelNumber=1)
+        evm.registerCallback(callback, MESSAGE_CHANNEL_BROADCAST_DATA)
+        evm.removeCallback(callback)
+        evm.dispatch([message.ChannelBroadcastDataMessage(number=1)])
+        self.assertEqual(callback.messages, [])
+        self.assertFalse(MESSAGE_CHANNEL_BROADCAST_DATA in evm.callbacks)
+
+    def test_request(self):
+        evm = self.evm
+        evm.driver = RecordingDriver()
+        evm.driver.open()
+        commands = [message.ChannelPeriodMessage(number) for number in range(3)]
+        requests = [evm.request(msg) for msg in commands]
+        self.assertEqual([msg.encode() for msg in evm.driver.messages],
+                         [msg.encode() for msg in commands])
+        
+        # acks arrive out of order and each one finds its own request
+        evm.dispatch([ackFor(commands[2]), ackFor(commands[0], 0x28)])
+        self.assertEqual([request.done() for request in requests], [True, False, True])
+        self.assertEqual(requests[2].result(timeout=0).channelNumber, 2)
+        self.assertRaises(MessageError, requests[0].result, timeout=0)
+        self.assertRaises(MessageError, requests[1].result, timeout=0)
+        self.assertEqual(evm.ack.waiters, {})
+
+    def test_requestTemplate(self):
+        evm = self.evm
+        evm.driver = RecordingDriver()
+        evm.driver.open()
+        command = message.ChannelPeriodMessage(3)
+        request = evm.request(message.FrameTemplate(command))
+        evm.dispatch([ackFor(command)])
+        self.assertEqual(request.result(timeout=0).channelNumber, 3)
+
+    def test_requestWriteError(self):
+        # any write error, not only a DriverError, leaves no waiter behind
+        evm = self.evm
+        evm.driver = RecordingDriver()
+        evm.driver.open()
+        evm.driver._write = lambda data: 1 // 0
+        self.assertRaises(ZeroDivisionError, evm.request, message.ChannelPeriodMessage())
+        self.assertEqual(evm.ack.waiters, {})
+        
+        # nor does a request that was never written
+        request = Request(evm.ack, message.ChannelPeriodMessage())
+        self.assertRaises(MessageError, request.result, timeout=0)
+        self.assertEqual(evm.ack.waiters, {})
+
+
+class CoalescingTest(unittest.TestCase):
+    def test_coalesce(self):
+        driver = RecordingDriver(coalesce=True)
+        driver.open()
+        try:
+            commands = [message.ChannelPeriodMessage(number % 8, 8192)
+                        for number in range(20)]
+            # the writer cannot take anything until all of them are queued
+            with driver._pendingCond:  # pylint: disable=protected-access
+                pending = [driver.submit(msg) for msg in commands]
+                self.assertFalse(any(write.done() for write in pending))
+            self.assertEqual([write.wait(1) for write in pending],
+                             [len(msg) for msg in commands])
+        finally:
+            driver.close()
+        self.assertEqual([msg.encode() for msg in driver.messages],
+                         [msg.encode() for msg in commands])
+        # 20 frames of 7 bytes, 9 to a 64 byte transfer
+        self.assertEqual([len(data) for data in driver.transfers], [63, 63, 14])
+
+    def test_close(self):
+        # close() lets the writer drain the queue before writes go direct
+        driver = RecordingDriver(coalesce=True)
+        driver.open()
+        pending = [driver.submit(message.ChannelPeriodMessage(number % 8))
+                   for number in range(20)]
+        driver.close()
+        self.assertTrue(all(write.done() and write.error is None for write in pending))
+        self.assertEqual(len(driver.messages), 20)
+        self.assertTrue(driver._writer is None)  # pylint: disable=protected-access
+
+    def test_template(self):
+        # a template updated while its frame is queued does not touch the frame
+        driver = RecordingDriver(coalesce=True)
+        driver.open()
+        template = message.FrameTemplate(message.ChannelBroadcastDataMessage(1))
+        try:
+            with driver._pendingCond:  # pylint: disable=protected-access
+                pending = driver.submit(template.encode())
+                template.update(0, b'\xff' * 8)
+            pending.wait(1)
+        finally:
+            driver.close()
+        self.assertEqual([msg.encode() for msg in driver.messages],
+                         [message.ChannelBroadcastDataMessage(1).encode()])
+
+    def test_error(self):
+        driver = RecordingDriver(coalesce=True)
+        driver.open()
+        driver._write = lambda data: 1 // 0
+        try:
+            pending = driver.submit(message.ChannelPeriodMessage())
+            self.assertRaises(DriverError, pending.wait, 1)
+        finally:
+            driver.close()
+
+    def test_requestError(self):
+        driver = RecordingDriver(coalesce=True)
+        driver._write = lambda data: 1 // 0
+        evm = EventMachine(driver)
+        driver.open()
+        try:
+            request = evm.request(message.ChannelPeriodMessage())
+            self.assertRaises(MessageError, request.result, timeout=5)
+            self.assertEqual(evm.ack.waiters, {})
+        finally:
+            driver.close()
@@ -28,9 +28,14 @@ from __future__ import division, absolute_import, print_function, unicode_litera
 
 LOG_LOCATION = '/tmp/python-ant.logtest.ant'
 
+import os
+import shutil
+import tempfile
+import time
 import unittest
 
-from ant.core.log import (LogReader, LogWriter,
+from ant.core.log import (LogReader, LogSet, LogWriter, FSYNC_FLUSH, INDEX_SUFFIX,
+                          buildIndex, readIndex,
                           EVENT_OPEN, EVENT_CLOSE, EVENT_READ, EVENT_WRITE)
 
 
@@ -69,20 +74,37 @@ class LogReaderTest(unittest.TestCase):
         self.assertEquals(t2[0], EVENT_READ)
         self.assertTrue(isinstance(t1[1], int))
         self.assertEquals(len(t2), 3)
-        self.assertEquals(t2[2], '\x01')
+        self.assertEquals(t2[2], b'\x01')
 
         self.assertEquals(t3[0], EVENT_WRITE)
         self.assertTrue(isinstance(t1[1], int))
         self.assertEquals(len(t3), 3)
-        self.assertEquals(t3[2], '\x00')
+        self.assertEquals(t3[2], b'\x00')
 
         self.assertEquals(t4[0], EVENT_READ)
-        self.assertEquals(t4[2], 'TEST')
+        self.assertEquals(t4[2], b'TEST')
 
         self.assertEquals(t5[0], EVENT_CLOSE)
         self.assertTrue(isinstance(t1[1], int))
         self.assertEquals(len(t5), 2)
 
+    def test_iter(self):
+        events = list(self.log)
+        self.assertEqual([event[0] for event in events],
+                         [EVENT_OPEN, EVENT_READ, EVENT_WRITE, EVENT_READ, EVENT_CLOSE])
+        self.assertEqual(self.log.read(), None)
+
+    def test_chunks(self):
+        # records straddle the reader's chunks
+        self.log.READ_SIZE = 3
+        self.log.open(LOG_LOCATION)
+        self.assertEqual(len(list(self.log)), 5)
+
+    def test_format(self):
+        with open(LOG_LOCATION, 'wb') as fd:
+            fd.write(b'not a log')
+        self.assertRaises(IOError, self.log.open, LOG_LOCATION)
+
 
 class LogWriterTest(unittest.TestCase):
     def setUp(self):
@@ -99,3 +121,234 @@ class LogWriterTest(unittest.TestCase):
         # Redundant, any error in log* methods will cause the LogReader test
         # suite to fail.
         pass
+
+
+class ThreadedLogWriterTest(unittest.TestCase):
+    def test_log(self):
+        log = LogWriter(LOG_LOCATION, threaded=True, flushInterval=0.01,
+                        fsync=FSYNC_FLUSH)
+        log.logOpen()
+        log.logRead(bytearray(b'\xA4\x01'))
+        log.logWrite(b'\x00')
+        log.close()
+        self.assertFalse(log.thread)
+        
+        events = list(LogReader(LOG_LOCATION))
+        self.assertEqual([event[0] for event in events],
+                         [EVENT_OPEN, EVENT_READ, EVENT_WRITE])
+        self.assertEqual(events[1][2], b'\xA4\x01')
+        self.assertEqual(events[2][2], b'\x00')
+
+    def test_dropped(self):
+        log = LogWriter(LOG_LOCATION, threaded=True, maxsize=3, flushInterval=10)
+        # the writer thread cannot drain anything while we hold the lock
+        with log.cond:
+            for _ in range(5):
+                log.logRead(b'\x00')
+        log.close()
+        self.assertEqual(log.dropped, 2)
+        self.assertEqual(len(list(LogReader(LOG_LOCATION))), 3)
+
+
+class LogVersion2Test(unittest.TestCase):
+    def write(self, **kwargs):
+        log = LogWriter(LOG_LOCATION, version=2, blockSize=2, **kwargs)
+        log.logOpen()
+        for index in range(4):
+            log.logRead(b'\xA4\x09\x4E' + bytes(bytearray([index])) * 9)
+        log.logWrite(bytearray(b'\x00'))
+        log.logClose()
+        log.close()
+        return list(LogReader(LOG_LOCATION))
+
+    def check(self, events):
+        self.assertEqual([event[0] for event in events],
+                         [EVENT_OPEN] + [EVENT_READ] * 4 + [EVENT_WRITE, EVENT_CLOSE])
+        self.assertEqual(events[3][2], b'\xA4\x09\x4E' + b'\x02' * 9)
+        self.assertEqual(events[5][2], b'\x00')
+        self.assertEqual(len(events[6]), 2)
+        
+        stamps = [event[1] for event in events]
+        self.assertEqual(stamps, sorted(stamps))
+        self.assertTrue(isinstance(stamps[0], float))
+        self.assertAlmostEqual(stamps[0], time.time(), delta=5)
+
+    def test_uncompressed(self):
+        self.check(self.write())
+
+    def test_zlib(self):
+        self.check(self.write(compression='zlib'))
+
+    def test_lzma(self):
+        self.check(self.write(compression='lzma'))
+
+    def test_threaded(self):
+        self.check(self.write(compression='zlib', threaded=True))
+
+    def test_unclosed(self):
+        # the block being filled is written when the writer is collected
+        log = LogWriter(LOG_LOCATION, version=2)
+        log.logOpen()
+        log.logRead(b'\xA4\x09\x4E')
+        log.logClose()
+        del log
+        self.assertEqual([event[0] for event in LogReader(LOG_LOCATION)],
+                         [EVENT_OPEN, EVENT_READ, EVENT_CLOSE])
+
+    def test_truncated(self):
+        # a block cut short by a crash is ignored, the ones before it are not
+        self.write()
+        with open(LOG_LOCATION, 'r+b') as fd:
+            fd.truncate(os.path.getsize(LOG_LOCATION) - 1)
+        self.assertEqual(len(list(LogReader(LOG_LOCATION))), 6)
+
+    def test_corrupt(self):
+        self.write()
+        reader = LogReader(LOG_LOCATION)
+        with open(LOG_LOCATION, 'r+b') as fd:
+            fd.seek(reader.fd.tell())
+            fd.write(b'XXXX')
+        self.assertRaises(IOError, list, reader)
+
+    def test_options(self):
+        self.assertRaises(ValueError, LogWriter, LOG_LOCATION, version=3)
+        self.assertRaises(ValueError, LogWriter, LOG_LOCATION, version=2,
+                          compression='bz2')
+        self.assertRaises(ValueError, LogWriter, LOG_LOCATION, compression='zlib')
+
+
+class IndexTest(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists(LOG_LOCATION + INDEX_SUFFIX):
+            os.remove(LOG_LOCATION + INDEX_SUFFIX)
+
+    def write(self, **kwargs):
+        # 40 reads, a second apart, with data telling them apart
+        log = LogWriter(LOG_LOCATION, **kwargs)
+        if log.version == 1:
+            stamps = iter(range(1000, 1040))
+        else:
+            stamps = iter(range(log.start, log.start + 40 * 10 ** 9, 10 ** 9))
+        log.clock = lambda: next(stamps)
+        for number in range(40):
+            log.logRead(bytearray([number]))
+        log.close()
+        return LogReader(LOG_LOCATION)
+
+    def check(self, log, start):
+        log.seek(start + 10.5)
+        self.assertEqual(log.read()[2], b'\x0b')
+        self.assertEqual(log.read()[2], b'\x0c')
+        
+        records = list(log.readRange(start + 30, start + 33))
+        self.assertEqual([record[2] for record in records], [b'\x1e', b'\x1f', b'\x20'])
+        
+        log.seek(start - 1)
+        self.assertEqual(log.read()[2], b'\x00')
+        log.seek(start + 100)
+        self.assertEqual(log.read(), None)
+
+    def test_version2(self):
+        log = self.write(version=2, compression='zlib', blockSize=4, index=True)
+        self.assertEqual(len(log.index), 10)
+        self.assertEqual([entry[2] for entry in log.index], list(range(0, 40, 4)))
+        self.check(log, log.read()[1])
+
+    def test_version1(self):
+        log = self.write(threaded=True, index=True)
+        self.assertEqual(log.index, [(1000.0, log.dataOffset, 0)])
+        self.check(log, 1000)
+
+    def test_build(self):
+        for options in (dict(version=2, blockSize=4, index=True),
+                        dict(version=1, index=True)):
+            self.write(**options)
+            written = readIndex(LOG_LOCATION + INDEX_SUFFIX)
+            buildIndex(LOG_LOCATION)
+            self.assertEqual(readIndex(LOG_LOCATION + INDEX_SUFFIX), written)
+
+    def test_build_version1(self):
+        log = self.write()
+        self.assertEqual(log.index, None)
+        self.assertEqual(buildIndex(LOG_LOCATION, interval=8), 5)
+        log = LogReader(LOG_LOCATION)
+        self.assertEqual([entry[0] for entry in log.index], [1000, 1008, 1016, 1024, 1032])
+        self.check(log, 1000)
+
+    def test_stale(self):
+        # rewriting a log without an index drops the one it had
+        self.write(version=2, blockSize=4, index=True)
+        log = self.write(version=2, blockSize=4)
+        self.assertFalse(os.path.exists(LOG_LOCATION + INDEX_SUFFIX))
+        self.assertEqual(log.index, None)
+        first = log.read()[1]
+        log.seek(first)
+        self.assertEqual(log.read()[1], first)
+
+    def test_unindexed(self):
+        # seeking without an index reads from the top
+        log = self.write(version=2, blockSize=4)
+        self.check(log, log.read()[1])
+
+
+class RotationTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, log, count=100):
+        for number in range(count):
+            log.logRead(b'\xA4' + bytearray([number]) * 9)
+        log.close()
+
+    def check(self, count=100):
+        events = list(LogSet(self.directory))
+        self.assertEqual([event[2][1:2] for event in events],
+                         [bytes(bytearray([number])) for number in range(count)])
+
+    def test_size(self):
+        self.write(LogWriter(self.directory, maxBytes=200, index=True))
+        files = sorted(os.listdir(self.directory))
+        # 100 records of 19 bytes, 10 to a file, and no empty file left over
+        self.assertEqual(len(files), 2 * 10)
+        self.assertEqual(len([name for name in files if name.endswith(INDEX_SUFFIX)]), 10)
+        self.check()
+
+    def test_prefix(self):
+        prefix = os.path.join(self.directory, 'capture.ant')
+        self.write(LogWriter(prefix, version=2, compression='zlib', blockSize=4,
+                             maxBytes=100))
+        files = os.listdir(self.directory)
+        self.assertTrue(len(files) > 1)
+        self.assertTrue(all(name.startswith('capture-') for name in files))
+        self.check()
+
+    def test_seconds(self):
+        log = LogWriter(self.directory, maxSeconds=0.05)
+        for _ in range(3):
+            log.logOpen()
+            time.sleep(0.06)
+        log.close()
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+
+    def test_threaded(self):
+        # the writer thread rotates between the batches it writes
+        log = LogWriter(self.directory, maxBytes=200, threaded=True, flushInterval=0.01)
+        for number in range(100):
+            log.logRead(b'\xA4' + bytearray([number]) * 9)
+            if number % 25 == 24:
+                time.sleep(0.1)
+        log.close()
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+        self.check()
+
+    def test_lazy(self):
+        self.write(LogWriter(self.directory, maxBytes=200))
+        logs = LogSet(self.directory)
+        self.assertEqual(len(logs.filenames), 10)
+        logs.read()
+        self.assertEqual(logs.position, 1)
+        logs.close()
+        self.assertEqual(logs.read(), None)
@@ -28,6 +28,11 @@ from __future__ import division, absolute_import, print_function, unicode_litera
 
 import unittest
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from ant.core.exceptions import MessageError
 from ant.core.constants import MESSAGE_SYSTEM_RESET, MESSAGE_CHANNEL_ASSIGN
 from ant.core.message import Message
@@ -69,6 +74,12 @@ class MessageTest(unittest.TestCase):
         msg = self.message = Message(type=MESSAGE_CHANNEL_ASSIGN)
         self.assertEqual(msg.encode(), b'\xA4\x03\x42\x00\x00\x00\xE5')
 
+    def test_encodeInto(self):
+        msg = self.message = Message(type=MESSAGE_CHANNEL_ASSIGN)
+        raw = bytearray(10)
+        self.assertEqual(msg.encodeInto(raw, 2), 7)
+        self.assertEqual(raw, b'\x00\x00\xA4\x03\x42\x00\x00\x00\xE5\x00')
+
     def test_decode(self):
         self.assertRaises(MessageError, Message.decode, b'\xA5\x03\x42\x00\x00\x00\xE5')
         self.assertRaises(MessageError, Message.decode,
@@ -86,6 +97,30 @@ class MessageTest(unittest.TestCase):
         self.assertRaises(MessageError, Message.decode, b'\xA4\x03\x42')
         self.assertRaises(MessageError, Message.decode, b'\xA4\x05\x42\x00\x00\x00\x00')
 
+    def test_decode_table(self):
+        raw = MSG.ChannelEventResponseMessage(2, MESSAGE_CHANNEL_ASSIGN, 0x15).encode()
+        msg = Message.decode(raw)
+        self.assertTrue(isinstance(msg, MSG.ChannelEventResponseMessage))
+        self.assertEqual(msg.channelNumber, 2)
+        self.assertEqual(msg.messageID, MESSAGE_CHANNEL_ASSIGN)
+        self.assertEqual(msg.messageCode, 0x15)
+        self.assertEqual(msg.encode(), raw)
+        
+        msg = Message.decode(b'\xA4\x01\xF0\x00\x55')
+        self.assertEqual(type(msg), Message)
+        self.assertEqual(msg.type, 0xF0)
+        self.assertEqual(msg.payload, b'\x00')
+
+    def test_freeze(self):
+        msg = MSG.ChannelIDMessage(number=1, device_number=0x0302)
+        self.assertFalse(hasattr(msg, '__dict__'))
+        self.assertTrue(msg.freeze() is msg)
+        self.assertEqual(msg.deviceNumber, 0x0302)
+        with self.assertRaises(TypeError):
+            msg.deviceNumber = 0x0403
+        with self.assertRaises(TypeError):
+            msg.channelNumber = 2
+
 
 class ChannelMessageTest(unittest.TestCase):
     def setUp(self):
@@ -428,3 +463,117 @@ class SerialNumberMessageTest(unittest.TestCase):
         msg = self.message
         msg.serialNumber = b'\x01\x02\x03\x04'
         self.assertEquals(msg.payload, b'\x01\x02\x03\x04')
+
+
+class FrameTemplateTest(unittest.TestCase):
+    def setUp(self):
+        self.template = MSG.FrameTemplate(MSG.ChannelBroadcastDataMessage(number=2))
+
+    def test_update(self):
+        data = b'\x01\x02\x03\x04\x05\x06\x07'
+        self.template.update(1, data)
+        msg = MSG.ChannelBroadcastDataMessage(number=2, data=data)
+        self.assertEqual(self.template.encode(), msg.encode())
+        self.template.update(4, b'\xA4')
+        self.assertEqual(Message.decode(self.template.encode()).payload,
+                         b'\x02\x01\x02\x03\xA4\x05\x06\x07')
+        self.assertRaises(MessageError, self.template.update, 7, b'\x00\x00')
+
+    def test_encodeInto(self):
+        raw = bytearray(len(self.template) + 1)
+        self.assertEqual(self.template.encodeInto(raw, 1), len(self.template))
+        self.assertEqual(raw[1:], self.template.encode())
+
+    def test_attributes(self):
+        self.assertEqual(self.template.type, MSG.ChannelBroadcastDataMessage.type)
+        self.assertEqual(self.template.channelNumber, 2)
+        key = MSG.FrameTemplate(MSG.NetworkKeyMessage(number=1))
+        self.assertEqual(key.number, 1)
+        self.assertRaises(AttributeError, getattr, key, 'channelNumber')
+        self.assertEqual(MSG.FrameTemplate(MSG.SystemResetMessage()).number, None)
+
+
+class FrameParserTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = MSG.FrameParser()
+        self.frame = MSG.ChannelIDMessage(number=1, device_number=0x0302).encode()
+
+    def test_feed(self):
+        msgs = list(self.parser.feed(self.frame + self.frame))
+        self.assertEqual(len(msgs), 2)
+        self.assertTrue(isinstance(msgs[0], MSG.ChannelIDMessage))
+        self.assertEqual(msgs[1].deviceNumber, 0x0302)
+        self.assertEqual(len(self.parser), 0)
+
+    def test_frozen(self):
+        self.parser.frozen = True
+        msg, = self.parser.feed(self.frame)
+        self.assertTrue(isinstance(msg.payload, bytes))
+        self.assertEqual(msg.encode(), self.frame)
+
+    def test_partial(self):
+        frame = self.frame
+        self.assertEqual(list(self.parser.feed(frame[:3])), [])
+        self.assertEqual(list(self.parser.feed(frame[3:-1])), [])
+        self.assertEqual(len(self.parser), len(frame) - 1)
+        msgs = list(self.parser.feed(frame[-1:] + frame[:2]))
+        self.assertEqual(len(msgs), 1)
+        self.assertEqual(msgs[0].channelNumber, 1)
+        self.assertEqual(len(self.parser), 2)
+
+    def test_resync(self):
+        corrupted = bytearray(self.frame)
+        corrupted[-1] ^= 0xFF
+        msgs = list(self.parser.feed(b'\x00\x01' + corrupted + self.frame))
+        self.assertEqual(len(msgs), 1)
+        self.assertEqual(msgs[0].encode(), self.frame)
+        self.assertEqual(len(self.parser), 0)
+        self.assertEqual(self.parser.discarded, 2 + len(corrupted))
+
+    def test_bad_length(self):
+        # a length over 9 is not waited on; the frames behind it still decode
+        msgs = list(self.parser.feed(self.frame + b'\xa4\x50' + self.frame * 3))
+        self.assertEqual(len(msgs), 4)
+        self.assertEqual(self.parser.discarded, 2)
+        self.assertEqual(len(self.parser), 0)
+        self.assertEqual(list(self.parser.feed(b'\xa4\x50')), [])
+        self.assertEqual(len(self.parser), 0)
+
+
+@unittest.skipIf(numpy is None, 'requires numpy')
+class ScanFramesTest(unittest.TestCase):
+    def setUp(self):
+        self.frame = MSG.ChannelBroadcastDataMessage(
+            3, b'\xA4\x01\x02\x03\x04\x05\x06\x07').encode()
+
+    def test_scan(self):
+        corrupted = bytearray(self.frame)
+        corrupted[-1] ^= 0xFF
+        raw = bytes(b'\x00' + self.frame + corrupted + self.frame + self.frame[:5])
+        frames, remainder = MSG.scanFrames(raw)
+        self.assertEqual(remainder, 5)
+        self.assertEqual(frames['offset'][0], 1)
+        self.assertEqual(frames['offset'][-1], 27)
+        self.assertEqual(frames['valid'].sum(), 2)
+        self.assertEqual(frames['type'][0], self.frame[2])
+        self.assertEqual(frames['channel'][0], 3)
+        self.assertEqual(frames['payload'][0].tobytes(), bytes(self.frame[3:-1]))
+
+    def test_bad_length(self):
+        raw = bytes(self.frame + b'\xa4\x50' + self.frame * 3)
+        frames, remainder = MSG.scanFrames(raw)
+        self.assertEqual(remainder, 0)
+        self.assertEqual(frames['offset'].tolist(), [0, 13, 15, 28, 41])
+        self.assertEqual(frames['valid'].tolist(), [True, False, True, True, True])
+        self.assertEqual(len(MSG.framesToMessages(frames)), 4)
+        
+        frames, remainder = MSG.scanFrames(bytes(self.frame + b'\xa4'))
+        self.assertEqual(remainder, 1)
+
+    def test_messages(self):
+        frames, remainder = MSG.scanFrames(bytes(self.frame * 3))
+        self.assertEqual(remainder, 0)
+        msgs = MSG.framesToMessages(frames)
+        self.assertEqual(len(msgs), 3)
+        self.assertTrue(isinstance(msgs[0], MSG.ChannelBroadcastDataMessage))
+        self.assertEqual(msgs[2].encode(), self.frame)
@@ -25,8 +25,134 @@
 
 from __future__ import division, absolute_import, print_function, unicode_literals
 
-#import unittest
+import unittest
+from threading import Condition
 
-#from ant.core.node import *
+from ant.core import message
+from ant.core.constants import (CHANNEL_TYPE_TWOWAY_RECEIVE, MESSAGE_CAPABILITIES,
+                                MESSAGE_CHANNEL_FREQUENCY, MESSAGE_CHANNEL_PERIOD,
+                                RESPONSE_NO_ERROR)
+from ant.core.driver import Driver
+from ant.core.exceptions import ChannelError
+from ant.core.message import Message
+from ant.core.node import Network, Node
 
-#TODO
+
+class StickDriver(Driver):
+    def __init__(self):
+        super(StickDriver, self).__init__()
+        self.buffer = bytearray()
+        self.ready = Condition()
+        self.isOpen = False
+        self.written = []
+        self.failing = set()
+
+    _opened = property(lambda self: self.isOpen)
+
+    def _open(self):
+        self.isOpen = True
+
+    def _close(self):
+        self.isOpen = False
+
+    def _read(self, count):
+        with self.ready:
+            if not self.buffer:
+                self.ready.wait(0.01)
+            data = bytes(self.buffer[:count])
+            del self.buffer[:count]
+        return data
+
+    def inject(self, msg):
+        with self.ready:
+            self.buffer += msg.encode()
+            self.ready.notify()
+
+    def _write(self, data):
+        msg = Message.decode(data)
+        self.written.append(msg)
+        if isinstance(msg, message.SystemResetMessage):
+            self.inject(message.StartupMessage())
+        elif isinstance(msg, message.ChannelRequestMessage) and \
+             msg.messageID == MESSAGE_CAPABILITIES:
+            self.inject(message.CapabilitiesMessage(4, 2))
+        else:
+            number = msg.number if isinstance(msg, message.NetworkKeyMessage) \
+                     else msg.channelNumber
+            # failing holds message types, or (type, channel) to fail one channel
+            failed = msg.type in self.failing or (msg.type, number) in self.failing
+            code = 0x28 if failed else RESPONSE_NO_ERROR
+            self.inject(message.ChannelEventResponseMessage(number, msg.type, code))
+        return len(data)
+
+
+class ConfigureTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = StickDriver()
+        self.node = Node(self.driver)
+        self.node.start()
+        self.network = Network(key=b'\x00' * 8)
+        self.node.setNetworkKey(0, self.network)
+
+    def tearDown(self):
+        self.node.stop()
+
+    def test_configure(self):
+        channel = self.node.getFreeChannel()
+        del self.driver.written[:]
+        channel.configure(network=self.network, channelType=CHANNEL_TYPE_TWOWAY_RECEIVE,
+                          channelID=(120, 0, 0), searchTimeout=255, period=8070,
+                          frequency=57, open=True)
+        self.assertEqual([type(msg) for msg in self.driver.written],
+                         [message.ChannelAssignMessage, message.ChannelIDMessage,
+                          message.ChannelSearchTimeoutMessage,
+                          message.ChannelPeriodMessage,
+                          message.ChannelFrequencyMessage,
+                          message.ChannelOpenMessage])
+        self.assertTrue(channel.network is self.network)
+        self.assertEqual(channel.device.type, 120)
+        self.assertEqual((channel.searchTimeout, channel.period, channel.frequency),
+                         (255, 8070, 57))
+        self.assertTrue(channel in self.node.evm.callbacks[None][channel.number])
+        self.assertFalse(any(self.node.evm.ack.mailboxes.values()))
+
+    def test_configure_channels(self):
+        first, second = self.node.channels[:2]
+        self.node.configureChannels([
+            (first, dict(network=self.network, period=8070)),
+            (second, dict(network=self.network, period=4035)),
+        ])
+        self.assertEqual((first.period, second.period), (8070, 4035))
+        self.assertTrue(second.network is self.network)
+
+    def test_configure_failure(self):
+        channel = self.node.getFreeChannel()
+        self.driver.failing.add(MESSAGE_CHANNEL_FREQUENCY)
+        with self.assertRaises(ChannelError):
+            channel.configure(network=self.network, period=8070, frequency=57,
+                              open=True)
+        self.assertEqual(channel.period, 8070)
+        self.assertTrue(channel.frequency is None)
+        # the stick did open the channel
+        self.assertTrue(channel in self.node.evm.callbacks[None][channel.number])
+        # the acks that were still in flight have been collected
+        self.assertFalse(any(self.node.evm.ack.mailboxes.values()))
+        self.assertEqual(self.node.evm.ack.waiters, {})
+
+    def test_configure_channels_failure(self):
+        first, second, third = self.node.channels[:3]
+        self.driver.failing.add((MESSAGE_CHANNEL_PERIOD, second.number))
+        with self.assertRaises(ChannelError):
+            self.node.configureChannels([
+                (channel, dict(network=self.network, period=8070, open=True))
+                for channel in (first, second, third)])
+        callbacks = self.node.evm.callbacks[None]
+        # what the stick acked is applied, past the failure too
+        for channel in (first, third):
+            self.assertTrue(channel.network is self.network)
+            self.assertEqual(channel.period, 8070)
+            self.assertTrue(channel in callbacks[channel.number])
+        self.assertTrue(second.network is self.network)
+        self.assertTrue(second.period is None)
+        self.assertTrue(second in callbacks[second.number])
+        self.assertFalse(any(self.node.evm.ack.mailboxes.values()))
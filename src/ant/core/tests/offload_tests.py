@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring, invalid-name
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import os
+import unittest
+
+from ant.core import message
+from ant.core.offload import OffloadCallback
+
+
+# runs in the workers: numbers every message of a channel as it sees it
+class Sequencer(object):
+    def __init__(self):
+        self.seen = {}
+
+    def process(self, msg):
+        number = msg.channelNumber
+        count = self.seen[number] = self.seen.get(number, 0) + 1
+        return os.getpid(), number, count, bytearray(msg.payload)[1]
+
+
+class Failing(Sequencer):
+    def process(self, msg):
+        if msg.channelNumber == 1:
+            raise ValueError('channel 1')
+        return super(Failing, self).process(msg)
+
+
+class OffloadCallbackTest(unittest.TestCase):
+    def test_order(self):
+        results = []
+        offload = OffloadCallback(Sequencer(), results.append, workers=2, batch=4)
+        try:
+            for index in range(30):
+                for number in range(3):
+                    offload.process(message.ChannelBroadcastDataMessage(
+                        number, data=bytearray((index,)) + b'\x00' * 7))
+        finally:
+            offload.stop()
+        
+        self.assertEqual(len(results), 90)
+        for number in range(3):
+            seen = [result for result in results if result[1] == number]
+            # one worker per channel, every message in order
+            self.assertEqual(len(set(result[0] for result in seen)), 1)
+            self.assertEqual([result[2] for result in seen], list(range(1, 31)))
+            self.assertEqual([result[3] for result in seen], list(range(30)))
+
+    def test_flush(self):
+        results = []
+        offload = OffloadCallback(Sequencer(), results.append, workers=1,
+                                  batch=64, flushInterval=0.01)
+        try:
+            offload.process(message.ChannelBroadcastDataMessage(5))
+            for _ in range(100):
+                if results:
+                    break
+                offload.stopped.wait(0.01)
+            self.assertEqual(len(results), 1)
+        finally:
+            offload.stop()
+
+    def test_error(self):
+        # a failing handler does not take its worker down
+        results = []
+        offload = OffloadCallback(Failing(), results.append, workers=1, batch=4)
+        try:
+            for number in (0, 1, 0, 1, 0):
+                offload.process(message.ChannelBroadcastDataMessage(number))
+        finally:
+            offload.stop()
+        self.assertEqual([result[2] for result in results], [1, 2, 3])
+        self.assertFalse(offload.workers[0].is_alive())
+
+    def test_dead_worker(self):
+        results = []
+        offload = OffloadCallback(Sequencer(), results.append, workers=2, batch=4)
+        offload.workers[0].terminate()
+        offload.workers[0].join()
+        offload.process(message.ChannelBroadcastDataMessage(1))
+        offload.stop()
+        self.assertEqual(len(results), 1)
+        self.assertFalse(any(worker.is_alive() for worker in offload.workers))
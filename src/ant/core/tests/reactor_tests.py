@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring, invalid-name
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import os
+import unittest
+from threading import Event
+
+from ant.core import message
+from ant.core.driver import USB1Driver
+from ant.core.event import EventCallback, EventMachine
+from ant.core.exceptions import DriverError
+from ant.core.reactor import Reactor
+from ant.core.simulator import SimulatedDriver
+
+
+class Counter(EventCallback):
+    def __init__(self, total):
+        self.messages = []
+        self.total = total
+        self.done = Event()
+
+    def process(self, msg):
+        self.messages.append(msg)
+        if len(self.messages) == self.total:
+            self.done.set()
+
+
+@unittest.skipUnless(hasattr(os, 'openpty'), 'requires a pseudo terminal')
+class ReactorTest(unittest.TestCase):
+    def setUp(self):
+        self.reactor = Reactor()
+        self.reactor.start()
+        self.ptys = [os.openpty() for _ in range(2)]
+        self.machines = [EventMachine(USB1Driver(os.ttyname(slave)), self.reactor)
+                         for _, slave in self.ptys]
+
+    def tearDown(self):
+        for evm in self.machines:
+            evm.stop()
+        self.reactor.stop()
+        for master, slave in self.ptys:
+            os.close(master)
+            os.close(slave)
+
+    def test_dispatch(self):
+        counters = []
+        for number, (evm, (master, _)) in enumerate(zip(self.machines, self.ptys)):
+            counter = Counter(10)
+            counters.append(counter)
+            evm.registerCallback(counter, channelNumber=number)
+            evm.start()
+            frame = message.ChannelBroadcastDataMessage(number).encode()
+            os.write(master, frame * 10)
+        for number, counter in enumerate(counters):
+            self.assertTrue(counter.done.wait(2))
+            self.assertTrue(all(msg.channelNumber == number for msg in counter.messages))
+
+    def test_stop(self):
+        first, second = self.machines
+        counter = Counter(1)
+        second.registerCallback(counter)
+        first.start()
+        second.start()
+        first.stop()
+        # the wakeup pipe and the second stick
+        self.assertEqual(len(self.reactor.selector.get_map()), 2)
+        os.write(self.ptys[1][0], message.StartupMessage().encode())
+        self.assertTrue(counter.done.wait(2))
+
+    def test_stop_reactor_first(self):
+        # the machine still closes its stick
+        evm = self.machines[0]
+        evm.start()
+        self.reactor.stop()
+        evm.stop()
+        self.assertFalse(evm.running)
+        self.assertFalse(evm.driver._serial.is_open)  # pylint: disable=protected-access
+
+    def test_no_fileno(self):
+        # refused in the caller, and the other sticks are still read
+        evm = EventMachine(SimulatedDriver(), self.reactor)
+        self.assertRaises(DriverError, evm.start)
+        self.assertFalse(evm.running)
+        self.assertTrue(self.reactor.thread.is_alive())
+        
+        first = self.machines[0]
+        counter = Counter(1)
+        first.registerCallback(counter)
+        first.start()
+        os.write(self.ptys[0][0], message.StartupMessage().encode())
+        self.assertTrue(counter.done.wait(2))
+
+    def test_bad_change(self):
+        evm = self.machines[0]
+        self.assertRaises(ValueError, self.reactor._change,  # pylint: disable=protected-access
+                          self.reactor._register, (evm, -1))  # pylint: disable=protected-access
+        self.assertTrue(self.reactor.thread.is_alive())
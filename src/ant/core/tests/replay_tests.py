@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring, invalid-name
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+LOG_LOCATION = '/tmp/python-ant.replaytest.ant'
+
+import time
+import unittest
+
+import msgpack
+
+from ant.core import message
+from ant.core.event import EventCallback, EventMachine
+from ant.core.log import EVENT_OPEN, EVENT_CLOSE, EVENT_READ, EVENT_WRITE
+from ant.core.replay import ReplayDriver
+
+
+class Recorder(EventCallback):
+    def __init__(self):
+        self.received = []
+
+    def process(self, msg):
+        self.received.append((time.time(), msg))
+
+
+class ReplayDriverTest(unittest.TestCase):
+    def setUp(self):
+        self.reset = message.SystemResetMessage().encode()
+        self.frames = [message.ChannelBroadcastDataMessage(number).encode()
+                       for number in range(4)]
+        self.record(msgpack.Packer())
+
+    def record(self, packer):
+        with open(LOG_LOCATION, 'wb') as fd:
+            fd.write(packer.pack(['ANT-LOG', 0x01]))
+            fd.write(packer.pack([EVENT_OPEN, 100]))
+            fd.write(packer.pack([EVENT_WRITE, 100, self.reset]))
+            # a frame split across reads, and one logged as a list
+            fd.write(packer.pack([EVENT_READ, 100, self.frames[0] + self.frames[1][:4]]))
+            fd.write(packer.pack([EVENT_READ, 100, self.frames[1][4:]]))
+            fd.write(packer.pack([EVENT_READ, 101, list(bytearray(self.frames[2]))]))
+            fd.write(packer.pack([EVENT_READ, 101, self.frames[3]]))
+            fd.write(packer.pack([EVENT_CLOSE, 101]))
+
+    def replay(self, speed):
+        driver = ReplayDriver(LOG_LOCATION, speed=speed, timeout=0.01)
+        evm = EventMachine(driver)
+        recorder = Recorder()
+        evm.registerCallback(recorder)
+        evm.start()
+        try:
+            self.assertTrue(driver.finished.wait(5))
+        finally:
+            evm.stop()
+        self.assertEqual([msg.encode() for _, msg in recorder.received], self.frames)
+        return [when for when, _ in recorder.received]
+
+    def test_maxSpeed(self):
+        times = self.replay(None)
+        self.assertTrue(times[-1] - times[0] < 0.5)
+
+    def test_scaled(self):
+        times = self.replay(10)
+        # one recorded second apart, played at ten times the speed
+        self.assertTrue(times[2] - times[1] >= 0.09)
+
+    def test_python2(self):
+        # Python 2 packed its str payloads as msgpack raw, not bin
+        self.record(msgpack.Packer(use_bin_type=False))
+        self.replay(None)
+
+    def test_verify(self):
+        driver = ReplayDriver(LOG_LOCATION, verify=True)
+        driver.open()
+        try:
+            driver.write(self.reset)
+            self.assertEqual(driver.mismatches, [])
+            driver.write(self.reset)
+            self.assertEqual(driver.mismatches, [(None, self.reset)])
+        finally:
+            driver.close()
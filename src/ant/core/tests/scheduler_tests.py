@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring, invalid-name
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import time
+import unittest
+
+from ant.core import message
+from ant.core.driver import Driver
+from ant.core.exceptions import DriverError
+from ant.core.message import Message
+from ant.core.scheduler import (TxScheduler, PRIORITY_ACKNOWLEDGED, PRIORITY_BROADCAST,
+                                PRIORITY_BURST, PRIORITY_CONTROL)
+
+
+class TimingDriver(Driver):
+    def __init__(self):
+        super(TimingDriver, self).__init__()
+        self.isOpen = False
+        self.written = []
+
+    _opened = property(lambda self: self.isOpen)
+
+    def _open(self):
+        self.isOpen = True
+
+    def _close(self):
+        self.isOpen = False
+
+    def _write(self, data):
+        self.written.append((time.time(), Message.decode(data)))
+        return len(data)
+
+
+class TxSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = TimingDriver()
+        self.driver.open()
+        self.scheduler = TxScheduler()
+        self.scheduler.start(self.driver)
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.driver.close()
+
+    def test_priority(self):
+        scheduler = self.scheduler
+        messages = [message.ChannelBroadcastDataMessage(1),
+                    message.ChannelBurstDataMessage(2),
+                    message.ChannelAcknowledgedDataMessage(3),
+                    message.ChannelPeriodMessage(4),
+                    message.ChannelBurstDataMessage(5)]
+        # nothing can be picked before everything is queued
+        with scheduler.cond:
+            pending = [scheduler.submit(msg) for msg in messages]
+        for write in pending:
+            write.wait(1)
+        self.assertEqual([msg.channelNumber for _, msg in self.driver.written],
+                         [4, 3, 2, 5, 1])
+        stats = scheduler.stats
+        self.assertEqual(stats[PRIORITY_CONTROL]['sent'], 1)
+        self.assertEqual(stats[PRIORITY_ACKNOWLEDGED]['sent'], 1)
+        self.assertEqual(stats[PRIORITY_BURST]['sent'], 2)
+        self.assertEqual(stats[PRIORITY_BROADCAST]['depth'], 0)
+
+    def test_pacing(self):
+        scheduler = self.scheduler
+        scheduler.write(message.ChannelPeriodMessage(0, 3277))  # 10 Hz
+        self.assertEqual(scheduler.periods[0], 3277)
+        
+        first = message.ChannelBroadcastDataMessage(0, data=b'\x01' * 8)
+        scheduler.write(first)
+        second = scheduler.submit(message.ChannelBroadcastDataMessage(0, data=b'\x02' * 8))
+        third = scheduler.submit(message.ChannelBroadcastDataMessage(0, data=b'\x03' * 8))
+        # another channel is not held up by this one
+        other = scheduler.submit(message.ChannelBroadcastDataMessage(1))
+        self.assertEqual(second.wait(1), 0)
+        self.assertTrue(third.wait(1) > 0)
+        self.assertTrue(other.wait(1) > 0)
+        
+        sent = [(when, msg) for when, msg in self.driver.written
+                if isinstance(msg, message.ChannelBroadcastDataMessage)]
+        self.assertEqual([msg.channelNumber for _, msg in sent], [0, 1, 0])
+        self.assertEqual(bytearray(sent[2][1].payload)[1], 3)
+        self.assertTrue(sent[2][0] - sent[0][0] >= 3277 / 32768 - 0.005)
+        self.assertEqual(scheduler.stats[PRIORITY_BROADCAST]['replaced'], 1)
+
+    def test_not_running(self):
+        scheduler = TxScheduler()
+        msg = message.ChannelPeriodMessage(0)
+        self.assertRaises(DriverError, scheduler.write, msg)
+        self.scheduler.stop()
+        self.assertRaises(DriverError, self.scheduler.submit, msg)
+
+    def test_timeout(self):
+        # a driver that never returns does not hang write() for good
+        self.scheduler.timeout = 0.05
+        self.driver._write = lambda data: time.sleep(0.5)
+        self.assertRaises(DriverError, self.scheduler.write, message.ChannelPeriodMessage(0))
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring, invalid-name
+##############################################################################
+#
+# Copyright (c) 2011, Martín Raúl Villalba
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+#
+##############################################################################
+#
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import unittest
+from threading import Event
+
+from ant.core import message
+from ant.core.constants import MESSAGE_CHANNEL_STATUS
+from ant.core.event import EventCallback
+from ant.core.exceptions import ChannelError
+from ant.core.node import Network, Node
+from ant.core.simulator import (HeartRateDevice, SimulatedDriver, VirtualDevice,
+                                STATE_ASSIGNED, STATE_TRACKING)
+
+
+class Collector(EventCallback):
+    def __init__(self, total):
+        self.messages = []
+        self.total = total
+        self.done = Event()
+
+    def process(self, msg, _channel):
+        self.messages.append(msg)
+        if len(self.messages) >= self.total:
+            self.done.set()
+
+
+class SimulatedDriverTest(unittest.TestCase):
+    def start(self, devices, realtime=False):
+        self.driver = SimulatedDriver(devices, realtime=realtime)
+        self.node = Node(self.driver)
+        self.node.start()
+        self.network = Network(key=b'\x00' * 8)
+        self.node.setNetworkKey(0, self.network)
+
+    def tearDown(self):
+        self.node.stop()
+
+    def open(self, channelID, period=8192):
+        channel = self.node.getFreeChannel()
+        collector = Collector(10)
+        channel.registerCallback(collector)
+        channel.configure(network=self.network, channelID=channelID, period=period,
+                          open=True)
+        return channel, collector
+
+    def status(self, channel):
+        msg = message.ChannelRequestMessage(channel.number, MESSAGE_CHANNEL_STATUS)
+        evm = self.node.evm
+        return evm.writeMessage(msg).waitForMessage(message.ChannelStatusMessage).status
+
+    def test_capabilities(self):
+        self.start([])
+        self.assertEqual(self.node.getCapabilities()[:2], (8, 3))
+
+    def test_broadcast(self):
+        self.start([HeartRateDevice(7, bpm=75), VirtualDevice(11, 3)])
+        channel, collector = self.open((120, 0, 0), period=8070)
+        self.assertTrue(collector.done.wait(2))
+        broadcasts = [msg for msg in collector.messages
+                      if isinstance(msg, message.ChannelBroadcastDataMessage)]
+        self.assertTrue(len(broadcasts) >= 10)
+        self.assertEqual(bytearray(broadcasts[-1].payload)[8], 75)
+        self.assertEqual(self.status(channel) & 0x03, STATE_TRACKING)
+        # the virtual clock moved one period per broadcast
+        self.assertTrue(self.driver.clock >= 10 * 8070 / 32768)
+        
+        channel.close()
+        self.assertEqual(self.status(channel) & 0x03, STATE_ASSIGNED)
+
+    def test_wrongState(self):
+        self.start([])
+        channel = self.node.getFreeChannel()
+        self.assertRaises(ChannelError, channel.open)
+
+    def test_realtime(self):
+        self.start([VirtualDevice(11, 3)], realtime=True)
+        _, collector = self.open((11, 3, 0), period=32768 // 64)
+        self.assertTrue(collector.done.wait(2))
+        counts = [bytearray(msg.payload)[1] for msg in collector.messages[:10]]
+        self.assertEqual(counts, list(range(10)))